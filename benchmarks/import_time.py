@@ -0,0 +1,69 @@
+"""
+Import-time benchmark for the tesspawner package
+
+Importing the package (e.g. to read the version) must not pull in the
+spawner's heavy dependencies. Run with
+
+    python benchmarks/import_time.py [--repeat N] [--max-ms MS]
+
+Exits non-zero if a heavy module was imported or the median import time
+exceeds --max-ms.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ["tes", "polling", "jupyterhub", "tesspawner.tesspawner"]
+
+SNIPPET = """
+import sys, time
+t0 = time.perf_counter()
+import tesspawner
+tesspawner.__version__
+t1 = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print("{{0:.3f}} {{1}}".format((t1 - t0) * 1e3, ",".join(heavy)))
+"""
+
+
+def measure(repeat):
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = SNIPPET.format(heavy=HEAVY_MODULES)
+    times = []
+    heavy = set()
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, "-c", code], cwd=here
+        ).decode().split()
+        times.append(float(out[0]))
+        if len(out) > 1:
+            heavy.update(out[1].split(","))
+    times.sort()
+    return times[len(times) // 2], sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=50.0)
+    args = parser.parse_args(argv)
+
+    median, heavy = measure(args.repeat)
+    print("import tesspawner: median {0:.3f} ms over {1} runs".format(
+        median, args.repeat
+    ))
+    status = 0
+    if heavy:
+        print("FAIL: eagerly imported {0}".format(", ".join(heavy)))
+        status = 1
+    if median > args.max_ms:
+        print("FAIL: slower than {0} ms".format(args.max_ms))
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
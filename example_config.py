@@ -453,6 +453,65 @@ c.Spawner.disable_user_config = True
 # ------------------------------------------------------------------------------
 c.JupyterHub.spawner_class = 'tesspawner.TesSpawner'
 c.TesSpawner.endpoint = "http://127.0.0.1:8000/v1/jobs"
+
+# Cancel tasks whose user has been idle on the hub for this long (seconds).
+#  Culling stops servers through the hub API and needs an admin token.
+# c.TesSpawner.cull_idle_timeout = 3600
+# c.TesSpawner.cull_api_token = ''
+# c.TesSpawner.cull_profiles = {
+#     'jupyter/tensorflow-notebook:latest': {'idle_timeout': 1800, 'max_age': 86400}
+# }
+
+# Executor stdout/stderr is tailed incrementally and kept in a bounded buffer
+#  per task. Admins can read it from /hub/api/tes/logs/<user>[/<server>].
+# from tesspawner.handlers import default_handlers
+# c.JupyterHub.extra_handlers = default_handlers
+# c.TesSpawner.log_buffer_lines = 1000
+# c.TesSpawner.log_fetch_interval = 2.0
+
+# Persist the task status cache so a restarted hub can answer polls right away.
+# c.TesSpawner.task_cache_path = '/home/ubuntu/jupyterhub/tes_tasks.sqlite'
+
+# Resubmit tasks lost to preemption or node failure, and sync the working
+#  directory to storage on stop so the next start picks up where it left off.
+# c.TesSpawner.respawn_states = ['SYSTEM_ERROR']
+# c.TesSpawner.max_respawns = 2
+# c.TesSpawner.checkpoint_url = 's3://jupyterhub/checkpoints/{username}'
+
+# Limit the cores, RAM (GB) and number of tasks a user or group can hold.
+# c.TesSpawner.user_quota = {'cpu': 8, 'mem': 64, 'tasks': 2}
+# c.TesSpawner.user_quotas = {'alice': {'cpu': 32, 'mem': 256, 'tasks': 4}}
+# c.TesSpawner.group_quotas = {'students': {'cpu': 64, 'mem': 512}}
+
+# Time TES calls and spawner methods, log the slowest ones every 5 minutes and
+#  report IOLoop stalls longer than a second. The summary is also served at
+#  /hub/api/tes/profile when the tesspawner handlers are registered.
+# c.TesSpawner.profile_calls = True
+# c.TesSpawner.stall_threshold = 1.0
+
+# Command run in the notebook executor, and extra commands per profile. By
+#  default they run in the background of the notebook executor (in the
+#  notebook image), so a prefetch fills the cache while the server starts.
+#  'when': 'before' runs one as a separate executor in its own image, but TES
+#  runs executors in order, so the notebook only starts once it exits.
+# c.TesSpawner.notebook_command = 'bash /usr/local/bin/start-singleuser.sh'
+# c.TesSpawner.profile_executors = {
+#     'jupyter/tensorflow-notebook:latest': [{
+#         'name': 'prefetch',
+#         'command': ['rsync', '-a', '/datasets/imagenet/', '/cache/'],
+#         'volumes': ['/cache'],
+#         'cpu': 1,
+#     }]
+# }
+
+# Each task's TES status is refreshed on its own schedule: often while it is
+#  queued or initializing, backing off while it keeps running. Hub polls in
+#  between are answered from the cache, so the hub can poll frequently.
+# c.Spawner.poll_interval = 5
+# c.TesSpawner.poll_intervals = {'QUEUED': [5, 15], 'INITIALIZING': [2, 10],
+#                                'RUNNING': [30, 600], '*': [10, 60]}
+# c.TesSpawner.poll_backoff = 2.0
+# c.TesSpawner.poll_jitter = 0.2
 c.Spawner.options_form = """
 <label for="image">Docker Image</label>
 <select name="image">
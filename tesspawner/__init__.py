@@ -1,6 +1,16 @@
 from __future__ import absolute_import
 
 from tesspawner._version import __version__
-from tesspawner.tesspawner import TesSpawner
 
 __all__ = ['__version__', 'TesSpawner']
+
+
+def __getattr__(name):
+    # TesSpawner pulls in jupyterhub, tornado and tes; only load them when the
+    # spawner is actually needed so tools that just want the version stay fast
+    if name == 'TesSpawner':
+        from tesspawner.tesspawner import TesSpawner
+        return TesSpawner
+    raise AttributeError(
+        "module {0!r} has no attribute {1!r}".format(__name__, name)
+    )
@@ -0,0 +1,127 @@
+"""
+Process-wide cache of TES task state shared by every TesSpawner in the hub
+"""
+
+import time
+
+
+TERMINAL_STATES = ["COMPLETE", "ERROR", "SYSTEM_ERROR", "CANCELED"]
+
+
+class TaskRecord(object):
+    """What the hub knows about a single TES task"""
+
+    __slots__ = ("task_id", "endpoint", "state", "user", "server", "key",
+                 "groups", "profile", "cpu", "mem", "created", "last_seen",
+                 "checked", "interval", "next_check", "host_ip", "port",
+                 "token_hash", "restored")
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.endpoint = ""
+        self.state = ""
+        self.user = ""
+        self.server = ""
+        # idempotency key, one live task per key
+        self.key = ""
+        self.groups = ()
+        self.profile = ""
+        self.cpu = 0
+        self.mem = 0.0
+        self.created = None
+        self.last_seen = None
+        # when the state was last confirmed by TES
+        self.checked = None
+        # current refresh interval and when the next refresh is due
+        self.interval = None
+        self.next_check = None
+        self.host_ip = None
+        self.port = None
+        # digest of the API token the task was started with
+        self.token_hash = ""
+        # loaded from disk and not yet confirmed by TES
+        self.restored = False
+
+    @property
+    def terminal(self):
+        return self.state in TERMINAL_STATES
+
+    def age(self, now=None):
+        """seconds since the task was submitted, None if unknown"""
+        if self.created is None:
+            return None
+        if now is None:
+            now = time.time()
+        return now - self.created
+
+
+class TaskStatusCache(object):
+    """Map of task_id -> TaskRecord
+
+    Spawners write into the cache whenever they learn something about a
+    task; other components (e.g. the idle culler) read from it instead of
+    querying TES themselves. If a store is attached, every change is
+    written through to it and the cache is seeded from it on attach.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self.store = None
+        # bumped on every change so readers can tell when to recompute
+        self.version = 0
+
+    def attach(self, store):
+        """persist to store, loading the records it already holds"""
+        self.store = store
+        for row in store.load():
+            if row["task_id"] in self._records:
+                continue
+            record = TaskRecord(row["task_id"])
+            for k, v in row.items():
+                setattr(record, k, v)
+            record.restored = True
+            self._records[record.task_id] = record
+        self.version += 1
+
+    def __contains__(self, task_id):
+        return task_id in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, task_id):
+        return self._records.get(task_id)
+
+    def update(self, task_id, **fields):
+        """merge fields into the record for task_id and mark it as seen"""
+        record = self._records.get(task_id)
+        if record is None:
+            record = TaskRecord(task_id)
+            self._records[task_id] = record
+        for k, v in fields.items():
+            setattr(record, k, v)
+        record.last_seen = time.time()
+        self.version += 1
+        if self.store is not None:
+            self.store.save(record)
+        return record
+
+    def remove(self, task_id):
+        self.version += 1
+        if self.store is not None:
+            self.store.delete(task_id)
+        return self._records.pop(task_id, None)
+
+    def records(self, user=None):
+        """all cached records, optionally restricted to one user"""
+        return [
+            r for r in list(self._records.values())
+            if user is None or r.user == user
+        ]
+
+    def find(self, key):
+        """the live record with idempotency key, if any"""
+        for r in list(self._records.values()):
+            if r.key == key and not r.terminal:
+                return r
+        return None
@@ -0,0 +1,184 @@
+"""
+Cull idle notebook tasks, combining hub activity with cached TES task state
+"""
+
+import json
+import time
+
+from datetime import datetime
+from urllib.parse import quote, urlencode
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import PeriodicCallback
+
+
+def _parse_date(s):
+    """parse the ISO 8601 timestamps returned by the hub REST API"""
+    if not s:
+        return None
+    s = s.rstrip("Z")
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            d = datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+        return (d - datetime(1970, 1, 1)).total_seconds()
+    return None
+
+
+class IdleCuller(object):
+    """Periodically stop notebook servers whose TES task sits idle
+
+    A task is culled when its user has shown no activity on the hub for
+    longer than the idle timeout of the task's profile, or when the task is
+    older than the profile's max age. Servers are stopped through the hub
+    API, at most `batch_size` at a time with `batch_delay` seconds between
+    batches, so the hub and TES are not hit by a burst of cancellations.
+    """
+
+    def __init__(self, cache, api_url, api_token, log, idle_timeout=0,
+                 max_age=0, profile_policies=None, interval=300,
+                 batch_size=10, batch_delay=5):
+        self.cache = cache
+        self.api_url = api_url.rstrip("/")
+        self.api_token = api_token
+        self.log = log
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.profile_policies = profile_policies or {}
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self._callback = None
+        self._running = False
+
+    def start(self):
+        if self._callback is not None:
+            return
+        self.log.info(
+            "Culling idle TES tasks every {0}s".format(self.interval)
+        )
+        self._callback = PeriodicCallback(self.cull, 1e3 * self.interval)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def policy(self, profile):
+        """(idle_timeout, max_age) in seconds for a profile, 0 disables"""
+        policy = self.profile_policies.get(profile, {})
+        return (
+            policy.get("idle_timeout", self.idle_timeout),
+            policy.get("max_age", self.max_age)
+        )
+
+    def _request(self, path, method="GET", headers=None):
+        headers = dict(headers or {})
+        headers["Authorization"] = "token {0}".format(self.api_token)
+        return HTTPRequest(self.api_url + path, method=method,
+                           headers=headers)
+
+    @gen.coroutine
+    def _list_users(self):
+        """every user with a running server, a page at a time
+
+        JupyterHub >= 2 returns at most api_page_max_limit users per
+        request; older hubs return them all and no pagination info.
+        """
+        users = []
+        offset = 0
+        while True:
+            resp = yield AsyncHTTPClient().fetch(self._request(
+                "/users?" + urlencode({"state": "active", "offset": offset}),
+                headers={"Accept": "application/jupyterhub-pagination+json"}
+            ))
+            page = json.loads(resp.body.decode("utf8", "replace"))
+            if isinstance(page, list):
+                users.extend(page)
+                return users
+            users.extend(page["items"])
+            following = (page.get("_pagination") or {}).get("next")
+            if not following or not page["items"]:
+                return users
+            offset = following["offset"]
+
+    @gen.coroutine
+    def _user_activity(self):
+        """last activity (epoch seconds) by user name and by
+        (user name, server name) where the hub reports it per server"""
+        users = yield self._list_users()
+        activity = {}
+        for u in users:
+            activity[u["name"]] = _parse_date(u.get("last_activity"))
+            for server_name, server in (u.get("servers") or {}).items():
+                activity[(u["name"], server_name)] = _parse_date(
+                    server.get("last_activity")
+                )
+        return activity
+
+    def find_idle(self, activity, now=None):
+        """(user, server name) of the servers that should be culled"""
+        if now is None:
+            now = time.time()
+        idle = []
+        for record in self.cache.records():
+            if record.terminal or not record.user:
+                continue
+            idle_timeout, max_age = self.policy(record.profile)
+            age = record.age(now)
+            # no activity reported (e.g. the user is not listed) says
+            # nothing about idleness, so only max_age applies
+            last_active = (activity.get((record.user, record.server)) or
+                           activity.get(record.user))
+            if max_age and age is not None and age > max_age:
+                reason = "age {0:.0f}s".format(age)
+            elif (idle_timeout and last_active is not None and
+                    now - last_active > idle_timeout):
+                reason = "idle {0:.0f}s".format(now - last_active)
+            else:
+                continue
+            self.log.info(
+                "Culling task {0} of {1}/{2} ({3}): {4}".format(
+                    record.task_id, record.user, record.server,
+                    record.profile, reason
+                )
+            )
+            if (record.user, record.server) not in idle:
+                idle.append((record.user, record.server))
+        return idle
+
+    @gen.coroutine
+    def _stop_server(self, user, server=""):
+        if server:
+            path = "/users/{0}/servers/{1}".format(
+                quote(user, safe=""), quote(server, safe="")
+            )
+        else:
+            path = "/users/{0}/server".format(quote(user, safe=""))
+        try:
+            yield AsyncHTTPClient().fetch(self._request(path, "DELETE"))
+        except Exception as e:
+            self.log.warning(
+                "Failed to cull server {0}/{1}: {2}".format(user, server, e)
+            )
+
+    @gen.coroutine
+    def cull(self):
+        if self._running:
+            return
+        self._running = True
+        try:
+            activity = yield self._user_activity()
+            idle = self.find_idle(activity)
+            for i in range(0, len(idle), self.batch_size):
+                if i > 0:
+                    yield gen.sleep(self.batch_delay)
+                yield [self._stop_server(u, server)
+                       for u, server in idle[i:i + self.batch_size]]
+        except Exception as e:
+            self.log.error("Idle culling failed: {0}".format(e))
+        finally:
+            self._running = False
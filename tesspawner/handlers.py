@@ -0,0 +1,104 @@
+"""
+Hub API handlers exposing TES task data to admins
+
+Register them with the hub, e.g.
+
+    from tesspawner.handlers import default_handlers
+    c.JupyterHub.extra_handlers = default_handlers
+"""
+
+import json
+
+from tornado import gen, web
+from jupyterhub.apihandlers import APIHandler
+from jupyterhub.utils import admin_only
+
+
+def _int_argument(handler, name, default):
+    """integer query argument, 400 if it is not one"""
+    value = handler.get_argument(name, None)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPError(
+            400, "{0} must be an integer, not {1!r}".format(name, value)
+        )
+
+
+class TaskLogHandler(APIHandler):
+    """GET /api/tes/logs/:user[/:server]?since=N&stream=stdout|stderr"""
+
+    def _find_spawner(self, name, server_name):
+        user = self.find_user(name)
+        if user is None:
+            raise web.HTTPError(404, "No such user: {0}".format(name))
+        spawners = getattr(user, "spawners", None)
+        if spawners is None:
+            return user.spawner
+        if server_name not in spawners:
+            raise web.HTTPError(
+                404, "No such server: {0}/{1}".format(name, server_name)
+            )
+        return spawners[server_name]
+
+    @admin_only
+    def get(self, name, server_name=""):
+        spawner = self._find_spawner(name, server_name or "")
+        if not hasattr(spawner, "get_logs"):
+            raise web.HTTPError(400, "Server is not spawned by TesSpawner")
+        since = _int_argument(self, "since", 0)
+        stream = self.get_argument("stream", None)
+        lines, next_seq = spawner.get_logs(since, stream)
+        self.write(json.dumps({
+            "task_id": spawner.task_id,
+            "lines": lines,
+            "next": next_seq
+        }))
+
+
+class UserServersHandler(APIHandler):
+    """DELETE /api/tes/users/:user/servers
+
+    Stop all of a user's running servers at once.
+    """
+
+    @admin_only
+    @gen.coroutine
+    def delete(self, name):
+        user = self.find_user(name)
+        if user is None:
+            raise web.HTTPError(404, "No such user: {0}".format(name))
+        spawners = getattr(user, "spawners", None) or {"": user.spawner}
+        running = [
+            server_name for server_name, spawner in spawners.items()
+            if getattr(spawner, "task_id", "")
+        ]
+        yield [self.stop_single_user(user, server_name)
+               for server_name in running]
+        self.write(json.dumps({"stopped": running}))
+
+
+class ProfileHandler(APIHandler):
+    """GET /api/tes/profile?top=N
+
+    Rolling summary of the slowest TES and spawner calls, when
+    TesSpawner.profile_calls is enabled.
+    """
+
+    @admin_only
+    def get(self):
+        from tesspawner.tesspawner import TesSpawner
+
+        if TesSpawner._profiler is None:
+            raise web.HTTPError(404, "Call profiling is not enabled")
+        top = _int_argument(self, "top", 10)
+        self.write(json.dumps(TesSpawner._profiler.summary(top)))
+
+
+default_handlers = [
+    (r"/api/tes/logs/([^/]+)/?([^/]*)", TaskLogHandler),
+    (r"/api/tes/users/([^/]+)/servers", UserServersHandler),
+    (r"/api/tes/profile", ProfileHandler),
+]
@@ -0,0 +1,408 @@
+"""
+Replay a login-storm trace against TesSpawner
+
+Each line of the trace is a JSON object
+
+    {"t": 0.25, "user": "alice", "formdata": {"cpu": ["2"], "mem": ["16"]}}
+
+where `t` is the offset in seconds from the start of the trace and
+`formdata` is what the spawn form posted; it is parsed with
+TesSpawner.options_from_form exactly as the hub would. Every event starts a
+real TesSpawner on the IOLoop, either against a TES server (--endpoint) or
+an in-process fake TES with configurable latency. Started servers are
+polled like the hub would until the run ends, then stopped. With --config,
+the TesSpawner settings of a jupyterhub_config.py are applied.
+
+    python -m tesspawner.loadtest trace.jsonl --speedup 10
+    python -m tesspawner.loadtest --synthetic 500 --window 60 \
+        --config jupyterhub_config.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+
+from collections import defaultdict
+from datetime import timedelta
+from types import SimpleNamespace
+
+from requests import HTTPError
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+
+
+class FakeTESClient(object):
+    """Just enough of tes.HTTPClient to run notebook tasks in memory
+
+    Each request blocks for `latency` seconds, like the synchronous HTTP
+    client does; a task turns RUNNING and gets an address after
+    `queue_delay` seconds.
+    """
+
+    def __init__(self, latency=0.01, queue_delay=1.0):
+        self.latency = latency
+        self.queue_delay = queue_delay
+        self._tasks = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _state(self, task_id):
+        task = self._tasks.get(task_id)
+        if task is None:
+            raise HTTPError("404 Client Error: Not Found",
+                            response=SimpleNamespace(status_code=404))
+        if task["state"] == "QUEUED" and time.time() >= task["ready"]:
+            task["state"] = "RUNNING"
+        return task["state"]
+
+    def create_task(self, task):
+        self._wait()
+        task_id = uuid.uuid4().hex
+        self._tasks[task_id] = {
+            "state": "QUEUED",
+            "ready": time.time() + random.expovariate(1.0 / self.queue_delay)
+            if self.queue_delay else time.time(),
+            "port": 30000 + len(self._tasks),
+            "message": task
+        }
+        return task_id
+
+    def get_task(self, task_id, view="MINIMAL"):
+        self._wait()
+        state = self._state(task_id)
+        logs = None
+        if view == "FULL" and state == "RUNNING":
+            executor_log = SimpleNamespace(
+                host_ip="127.0.0.1",
+                ports=[SimpleNamespace(
+                    host=self._tasks[task_id]["port"], container=8888
+                )],
+                stdout="", stderr=""
+            )
+            logs = [SimpleNamespace(logs=[executor_log])]
+        return SimpleNamespace(
+            id=task_id, state=state, logs=logs, tags={}
+        )
+
+    def cancel_task(self, task_id):
+        self._wait()
+        self._tasks[task_id]["state"] = "CANCELED"
+
+    def get_task_states(self, tag_key, tag_value, task_ids):
+        self._wait()
+        return dict(
+            (t, self._state(t)) for t in task_ids
+            if t in self._tasks and
+            self._tasks[t]["message"].tags.get(tag_key) == tag_value
+        )
+
+
+# the fake TES takes task messages as they are, so they are built from plain
+# namespaces and the test runs with any py-tes version
+FAKE_MODELS = SimpleNamespace(
+    Task=SimpleNamespace, TaskParameter=SimpleNamespace,
+    Resources=SimpleNamespace, Ports=SimpleNamespace,
+    Executor=SimpleNamespace
+)
+
+
+class CountingClient(object):
+    """Record the time of every call made to a TES client"""
+
+    def __init__(self, client):
+        self._inner = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            self.calls.append((time.time(), name))
+            return attr(*args, **kwargs)
+        return wrapper
+
+
+def load_trace(path):
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda e: e["t"])
+
+
+def synthetic_trace(n, window, profiles=None):
+    """n logins spread uniformly over window seconds"""
+    profiles = profiles or [
+        {"image": ["jupyter/datascience-notebook:latest"], "cpu": ["1"],
+         "mem": ["8"]},
+        {"image": ["jupyter/tensorflow-notebook:latest"], "cpu": ["4"],
+         "mem": ["32"]},
+    ]
+    return sorted(
+        [
+            {"t": random.uniform(0, window),
+             "user": "loadtest-{0}".format(i),
+             "formdata": random.choice(profiles)}
+            for i in range(n)
+        ],
+        key=lambda e: e["t"]
+    )
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))
+    return values[k]
+
+
+class LoadTest(object):
+
+    def __init__(self, events, client, endpoint="", speedup=1.0,
+                 poll_interval=30.0, log=None, config=None, models=None):
+        self.events = events
+        self.client = client
+        self.endpoint = endpoint
+        self.speedup = speedup
+        self.poll_interval = poll_interval
+        self.log = log or logging.getLogger("tesspawner.loadtest")
+        self.config = config
+        self.models = models
+        self.results = []
+        self.spawners = []
+        # seconds until the last spawn finished / the last server stopped
+        self.duration = 0.0
+        self.elapsed = 0.0
+        self._done = Event()
+
+    def _make_spawner(self, event):
+        from tesspawner.tesspawner import TesSpawner
+
+        name = event["user"]
+        server = SimpleNamespace(
+            cookie_name="jupyter-hub-token-{0}".format(name),
+            base_url="/user/{0}/".format(name)
+        )
+        user = SimpleNamespace(
+            name=name, escaped_name=name, server=server,
+            url="/user/{0}/".format(name), groups=[]
+        )
+        hub_server = SimpleNamespace(base_url="/hub/")
+        hub = SimpleNamespace(
+            server=hub_server, api_url="http://127.0.0.1:8081/hub/api",
+            base_url="/hub/", public_host="", url="http://127.0.0.1:8081/hub/"
+        )
+        kwargs = {}
+        if self.config is not None:
+            kwargs["config"] = self.config
+        if self.endpoint:
+            kwargs["endpoint"] = self.endpoint
+        spawner = TesSpawner(user=user, hub=hub, log=self.log, **kwargs)
+        spawner._tes_client = self.client
+        if self.models is not None:
+            spawner._tes_models = self.models
+        spawner.user_options = spawner.options_from_form(
+            event.get("formdata", {})
+        )
+        return spawner
+
+    @gen.coroutine
+    def _spawn(self, event, t0):
+        # a result is recorded whatever fails, run() waits for all of them
+        result = {"user": event.get("user"), "due": t0, "begin": t0,
+                  "ok": False}
+        try:
+            result["due"] = t0 + event["t"] / self.speedup
+            delay = result["due"] - time.time()
+            if delay > 0:
+                yield gen.sleep(delay)
+            result["begin"] = time.time()
+            spawner = self._make_spawner(event)
+            self.spawners.append(spawner)
+            yield spawner.start()
+            result["ok"] = True
+        except Exception as e:
+            self.log.error("Spawn for {0} failed: {1}".format(
+                result["user"], e
+            ))
+        finally:
+            result["end"] = time.time()
+            self.results.append(result)
+        if result["ok"]:
+            yield self._poll(spawner)
+
+    @gen.coroutine
+    def _poll(self, spawner):
+        interval = self.poll_interval / self.speedup
+        while not self._done.is_set():
+            try:
+                # wakes up as soon as the run ends
+                yield self._done.wait(timedelta(seconds=interval))
+                break
+            except gen.TimeoutError:
+                pass
+            try:
+                status = yield spawner.poll()
+            except Exception as e:
+                self.log.error("Poll of {0} failed: {1}".format(
+                    spawner.user.name, e
+                ))
+                break
+            if status is not None:
+                break
+
+    @gen.coroutine
+    def run(self):
+        t0 = time.time()
+        spawns = [self._spawn(e, t0) for e in self.events]
+        # keep polling until the last spawn has finished
+        while len(self.results) < len(self.events):
+            yield gen.sleep(0.1)
+        self._done.set()
+        self.duration = time.time() - t0
+        yield spawns
+        for spawner in self.spawners:
+            if spawner.task_id:
+                yield spawner.stop()
+        # TES requests are counted until the last server is stopped
+        self.elapsed = time.time() - t0
+
+    def report(self):
+        ok = [r for r in self.results if r["ok"]]
+        latency = [r["end"] - r["begin"] for r in ok]
+        total = [r["end"] - r["due"] for r in ok]
+        lag = [r["begin"] - r["due"] for r in self.results]
+
+        per_method = defaultdict(list)
+        for t, method in self.client.calls:
+            per_method[method].append(t)
+        requests = {}
+        for method, times in per_method.items():
+            per_second = defaultdict(int)
+            for t in times:
+                per_second[int(t)] += 1
+            requests[method] = {
+                "count": len(times),
+                "rate": len(times) / self.elapsed if self.elapsed else 0.0,
+                "peak": max(per_second.values())
+            }
+
+        def cdf(values):
+            return dict(
+                ("p{0}".format(p), percentile(values, p))
+                for p in (50, 90, 95, 99, 100)
+            )
+
+        return {
+            "spawns": len(self.results),
+            "failed": len(self.results) - len(ok),
+            "duration": self.duration,
+            "elapsed": self.elapsed,
+            "throughput": len(ok) / self.duration if self.duration else 0.0,
+            "start_latency": cdf(latency),
+            "login_to_ready": cdf(total),
+            "queueing": cdf(lag),
+            "tes_requests": requests
+        }
+
+
+def format_report(report):
+    lines = [
+        "spawns: {spawns} ({failed} failed) in {duration:.1f}s, "
+        "{throughput:.2f} spawns/s".format(**report)
+    ]
+    for key, label in [("start_latency", "start() latency"),
+                       ("login_to_ready", "login to ready"),
+                       ("queueing", "queueing before start()")]:
+        cdf = report[key]
+        lines.append(
+            "{0:>24}: ".format(label) + "  ".join(
+                "{0}={1:.3f}s".format(p, cdf[p])
+                for p in ("p50", "p90", "p95", "p99", "p100")
+            )
+        )
+    lines.append("TES requests:")
+    for method, r in sorted(report["tes_requests"].items()):
+        lines.append(
+            "{0:>24}: {count} total, {rate:.1f}/s avg, {peak}/s peak".format(
+                method, **r
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a login trace against TesSpawner"
+    )
+    parser.add_argument("trace", nargs="?", help="JSON-lines trace file")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="generate this many logins instead of a trace")
+    parser.add_argument("--window", type=float, default=60.0,
+                        help="seconds the synthetic logins are spread over")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="replay the trace this many times faster")
+    parser.add_argument("--endpoint", default="",
+                        help="TES server to use instead of the fake one")
+    parser.add_argument("--config",
+                        help="jupyterhub_config.py to configure TesSpawner")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="fake TES: seconds per request")
+    parser.add_argument("--queue-delay", type=float, default=1.0,
+                        help="fake TES: mean seconds before a task runs")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="hub poll interval in trace seconds")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        events = synthetic_trace(args.synthetic, args.window)
+    elif args.trace:
+        events = load_trace(args.trace)
+    else:
+        parser.error("either a trace file or --synthetic is required")
+
+    config = None
+    if args.config:
+        from traitlets.config.loader import PyFileConfigLoader
+        path = os.path.abspath(args.config)
+        config = PyFileConfigLoader(
+            os.path.basename(path), os.path.dirname(path)
+        ).load_config()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.endpoint:
+        from tes import HTTPClient
+        from tesspawner.client import TesClient
+        client = TesClient(HTTPClient(args.endpoint))
+        models = None
+    else:
+        client = FakeTESClient(args.latency, args.queue_delay)
+        models = FAKE_MODELS
+
+    test = LoadTest(
+        events, CountingClient(client), endpoint=args.endpoint,
+        speedup=args.speedup, poll_interval=args.poll_interval,
+        config=config, models=models
+    )
+    IOLoop.current().run_sync(test.run)
+    report = test.report()
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
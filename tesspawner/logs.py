@@ -0,0 +1,145 @@
+"""
+Incremental tailing of notebook executor stdout/stderr
+
+TES only returns executor logs as part of the FULL task view, so every
+consumer that wants to look at a task's output would otherwise fetch and
+re-read the whole view. TaskLogTail fetches the view at most once per
+`min_interval` seconds, keeps the offset it has already consumed for each
+(attempt, executor, stream) and only appends the new chunk to a bounded ring
+buffer. Readers ask for lines after a sequence number and are served from
+the buffer.
+
+Backends may only return the last part of a long log. To tell when such a
+tail has moved on, the end of what was consumed last time is kept and looked
+up again in the next fetch. This cannot see a shift when the new tail happens
+to end the same way at the same offset (e.g. a log repeating one line), and
+lines that scrolled out of the tail between two fetches are lost.
+"""
+
+import time
+
+from collections import deque
+
+
+STREAMS = ("stdout", "stderr")
+
+# characters kept from the end of each consumed log to find it again
+ANCHOR_SIZE = 256
+
+
+class TaskLogTail(object):
+    """Bounded ring buffer of one task's executor output"""
+
+    def __init__(self, task_id, max_lines=1000, min_interval=2.0):
+        self.task_id = task_id
+        self.min_interval = min_interval
+        self.lines = deque(maxlen=max_lines)
+        # sequence number of the next line appended to the buffer
+        self.next_seq = 0
+        self.last_fetch = None
+        # keyed by (attempt, executor, stream)
+        self._offsets = {}
+        self._anchors = {}
+        self._partial = {}
+
+    @property
+    def first_seq(self):
+        return self.next_seq - len(self.lines)
+
+    def stale(self, now=None):
+        if self.last_fetch is None:
+            return True
+        if now is None:
+            now = time.time()
+        return now - self.last_fetch >= self.min_interval
+
+    def feed(self, key, content):
+        """consume the full current content of the log identified by key,
+        an (attempt, executor, stream) tuple, and keep the new part"""
+        if content is None:
+            return 0
+        offset = self._offsets.get(key, 0)
+        anchor = self._anchors.get(key, "")
+        partial = self._partial.get(key, "")
+        if content[offset - len(anchor):offset] != anchor:
+            # the backend truncated the log or only returns a tail that has
+            # moved on; resume after the last text we consumed
+            offset = self._resume(content, anchor)
+            if offset is None:
+                offset = 0
+                partial = ""
+        chunk = partial + content[offset:]
+        self._offsets[key] = len(content)
+        self._anchors[key] = content[-ANCHOR_SIZE:]
+
+        parts = chunk.split("\n")
+        self._partial[key] = parts.pop()
+        for line in parts:
+            self.lines.append((self.next_seq, key, line))
+            self.next_seq += 1
+        return len(parts)
+
+    @staticmethod
+    def _resume(content, anchor):
+        """offset in content right after anchor, None if it is not there"""
+        found = content.rfind(anchor)
+        if found >= 0:
+            return found + len(anchor)
+        # the tail moved past the start of the anchor; look for the anchor's
+        # last complete lines at the start of content
+        for i, c in enumerate(anchor[:-1]):
+            if c == "\n" and content.startswith(anchor[i + 1:]):
+                return len(anchor) - i - 1
+        return None
+
+    def update(self, task):
+        """feed the executor logs of a FULL task view"""
+        self.last_fetch = time.time()
+        new = 0
+        for attempt, task_log in enumerate(task.logs or []):
+            for executor, executor_log in enumerate(task_log.logs or []):
+                for stream in STREAMS:
+                    new += self.feed(
+                        (attempt, executor, stream),
+                        getattr(executor_log, stream, None)
+                    )
+        return new
+
+    def read(self, since=0, stream=None):
+        """lines with a sequence number >= since
+
+        Returns (lines, next) where next is the value to pass as `since`
+        on the following call.
+        """
+        lines = [
+            {"seq": seq, "attempt": key[0], "executor": key[1],
+             "stream": key[2], "line": line}
+            for seq, key, line in list(self.lines)
+            if seq >= since and (stream is None or key[2] == stream)
+        ]
+        return lines, self.next_seq
+
+
+class TaskLogStore(object):
+    """Per-task log tails shared by every spawner in the hub process"""
+
+    def __init__(self, max_tasks=500):
+        self.max_tasks = max_tasks
+        self._tails = {}
+
+    def get(self, task_id, **kwargs):
+        tail = self._tails.get(task_id)
+        if tail is None:
+            if len(self._tails) >= self.max_tasks:
+                # evict the tail that was fetched least recently
+                oldest = min(
+                    self._tails.values(),
+                    key=lambda t: t.last_fetch or 0
+                )
+                self._tails.pop(oldest.task_id, None)
+            tail = TaskLogTail(task_id, **kwargs)
+            self._tails[task_id] = tail
+        return tail
+
+    def remove(self, task_id):
+        return self._tails.pop(task_id, None)
@@ -0,0 +1,201 @@
+"""
+Opt-in timing of TES client calls and spawner methods, and detection of
+IOLoop stalls
+"""
+
+import functools
+import heapq
+import sys
+import threading
+import time
+import traceback
+
+from collections import defaultdict, deque
+
+from tornado.concurrent import Future
+from tornado.ioloop import PeriodicCallback
+
+
+class CallProfiler(object):
+    """Rolling record of how long calls take
+
+    Keeps the calls of the last `window` seconds (at most `max_calls`) and
+    summarizes them by name.
+    """
+
+    def __init__(self, window=600, max_calls=10000):
+        self.window = window
+        self._calls = deque(maxlen=max_calls)
+
+    def record(self, name, duration):
+        self._calls.append((time.time(), name, duration))
+
+    def _recent(self):
+        cutoff = time.time() - self.window
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+        return list(self._calls)
+
+    def summary(self, top=10):
+        """per-name stats and the slowest individual calls"""
+        calls = self._recent()
+        by_name = defaultdict(list)
+        for _, name, duration in calls:
+            by_name[name].append(duration)
+        stats = {}
+        for name, durations in by_name.items():
+            durations.sort()
+            stats[name] = {
+                "count": len(durations),
+                "total": sum(durations),
+                "p50": durations[len(durations) // 2],
+                "max": durations[-1]
+            }
+        slowest = heapq.nlargest(top, calls, key=lambda c: c[2])
+        return {
+            "window": self.window,
+            "calls": stats,
+            "slowest": [
+                {"time": t, "name": name, "duration": duration}
+                for t, name, duration in slowest
+            ]
+        }
+
+    def format_summary(self, top=10):
+        summary = self.summary(top)
+        lines = ["Slowest TesSpawner calls in the last {0}s:".format(
+            summary["window"]
+        )]
+        for name, s in sorted(summary["calls"].items(),
+                              key=lambda i: -i[1]["max"]):
+            lines.append(
+                "  {0}: {1} calls, p50 {2:.3f}s, max {3:.3f}s".format(
+                    name, s["count"], s["p50"], s["max"]
+                )
+            )
+        return "\n".join(lines)
+
+    def wrap(self, client, prefix="tes."):
+        return ProfiledClient(client, self, prefix)
+
+
+class ProfiledClient(object):
+    """Time every method call made on a client"""
+
+    def __init__(self, client, profiler, prefix):
+        self._inner = client
+        self._profiler = profiler
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._profiler.record(
+                    self._prefix + name, time.perf_counter() - start
+                )
+        return wrapper
+
+
+def profiled(name):
+    """Time a spawner method, or the coroutine it returns, when the
+    spawner has profiling enabled"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._get_profiler()
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            if isinstance(result, Future):
+                result.add_done_callback(
+                    lambda f: profiler.record(
+                        name, time.perf_counter() - start
+                    )
+                )
+            else:
+                profiler.record(name, time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+class StallDetector(object):
+    """Report when the IOLoop stops turning for longer than `threshold`
+
+    A callback on the loop updates a heartbeat every `interval` seconds; a
+    watchdog thread checks it and, when it is older than the threshold,
+    logs a sample of the loop thread's stack once per stall.
+    """
+
+    def __init__(self, log, threshold=1.0, interval=0.1, profiler=None):
+        self.log = log
+        self.threshold = threshold
+        self.interval = interval
+        self.profiler = profiler
+        self._heartbeat = time.perf_counter()
+        self._loop_thread = None
+        self._callback = None
+        self._stopped = threading.Event()
+
+    def _beat(self):
+        now = time.perf_counter()
+        stalled = now - self._heartbeat - self.interval
+        if self.profiler is not None and stalled > self.threshold:
+            self.profiler.record("ioloop.stall", stalled)
+        self._heartbeat = now
+
+    def start(self):
+        if self._callback is not None:
+            return
+        self._loop_thread = threading.current_thread().ident
+        self._heartbeat = time.perf_counter()
+        self._callback = PeriodicCallback(self._beat, 1e3 * self.interval)
+        self._callback.start()
+        thread = threading.Thread(target=self._watch, name="stall-detector")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.perf_counter() - heartbeat
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.log.warning(
+                "IOLoop stalled for {0:.2f}s, loop thread at:\n{1}".format(
+                    stalled, stack
+                )
+            )
+
+
+def start_profiling(log, stall_threshold=0, summary_interval=300):
+    """Create a profiler, plus a stall detector and a periodic summary in
+    the log if enabled, on the current IOLoop"""
+    profiler = CallProfiler()
+    if stall_threshold:
+        StallDetector(log, stall_threshold, profiler=profiler).start()
+    if summary_interval:
+        PeriodicCallback(
+            lambda: log.info(profiler.format_summary()),
+            1e3 * summary_interval
+        ).start()
+    return profiler
@@ -0,0 +1,81 @@
+"""
+Per-user and per-group resource quotas for notebook tasks
+"""
+
+from collections import defaultdict
+
+
+RESOURCES = ("cpu", "mem", "tasks")
+
+
+class QuotaExceeded(Exception):
+    """Raised when starting a task would exceed a quota"""
+
+
+class UsageLedger(object):
+    """Cores, RAM (GB) and task counts held by each user and group
+
+    The ledger is derived from the shared task status cache and only rebuilt
+    when the cache has changed since the last rebuild.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._version = None
+        self._users = {}
+        self._groups = {}
+
+    def _rebuild(self):
+        if self._version == self.cache.version:
+            return
+        users = defaultdict(lambda: dict.fromkeys(RESOURCES, 0))
+        groups = defaultdict(lambda: dict.fromkeys(RESOURCES, 0))
+        for record in self.cache.records():
+            if record.terminal or not record.user:
+                continue
+            usage = {
+                "cpu": record.cpu or 0, "mem": record.mem or 0, "tasks": 1
+            }
+            for ledger in [users[record.user]] + [
+                groups[g] for g in record.groups or ()
+            ]:
+                for k, v in usage.items():
+                    ledger[k] += v
+        self._users = dict(users)
+        self._groups = dict(groups)
+        self._version = self.cache.version
+
+    def user_usage(self, user):
+        self._rebuild()
+        return self._users.get(user, dict.fromkeys(RESOURCES, 0))
+
+    def group_usage(self, group):
+        self._rebuild()
+        return self._groups.get(group, dict.fromkeys(RESOURCES, 0))
+
+    @staticmethod
+    def _check(kind, name, usage, request, limits):
+        for k in RESOURCES:
+            limit = limits.get(k)
+            if limit is None:
+                continue
+            if usage[k] + request[k] > limit:
+                raise QuotaExceeded(
+                    "{0} {1} would use {2} {3}, over its quota of {4}".format(
+                        kind, name, usage[k] + request[k], k, limit
+                    )
+                )
+
+    def check(self, user, groups, cpu, mem, user_limits, group_limits):
+        """raise QuotaExceeded if a new task of cpu cores and mem GB would
+        take user, or any of their groups, over its limits
+
+        user_limits is a dict of resource -> limit; group_limits maps group
+        names to such dicts. Missing resources are unlimited.
+        """
+        request = {"cpu": cpu, "mem": mem, "tasks": 1}
+        self._check("User", user, self.user_usage(user), request, user_limits)
+        for group in groups:
+            if group in group_limits:
+                self._check("Group", group, self.group_usage(group), request,
+                            group_limits[group])
@@ -0,0 +1,83 @@
+"""
+On-disk copy of the task status cache, so a restarted hub knows where its
+tasks are without asking TES first
+"""
+
+import os
+import sqlite3
+
+
+COLUMNS = ("task_id", "endpoint", "state", "user", "server", "key",
+           "groups", "profile", "cpu", "mem", "created", "last_seen",
+           "host_ip", "port", "token_hash")
+
+TYPES = {"created": "REAL", "last_seen": "REAL", "port": "INTEGER",
+         "cpu": "INTEGER", "mem": "REAL"}
+
+
+class TaskStore(object):
+    """SQLite table of task_id -> endpoint, state, host_ip, port, ...
+
+    Every cache update is written through as a single upsert. The database
+    runs in WAL mode with relaxed syncing: losing the last few writes on a
+    power failure is fine since the hub reconciles against TES anyway.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY)"
+        )
+        # add columns introduced since the file was created
+        existing = set(
+            row[1] for row in self._db.execute("PRAGMA table_info(tasks)")
+        )
+        for c in COLUMNS:
+            if c not in existing:
+                self._db.execute(
+                    "ALTER TABLE tasks ADD COLUMN {0} {1}".format(
+                        c, TYPES.get(c, "TEXT")
+                    )
+                )
+
+    def save(self, record):
+        self._db.execute(
+            "INSERT OR REPLACE INTO tasks ({0}) VALUES ({1})".format(
+                ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))
+            ),
+            [self._dump(c, getattr(record, c)) for c in COLUMNS]
+        )
+
+    @staticmethod
+    def _dump(column, value):
+        if column == "groups":
+            return ",".join(value)
+        return value
+
+    @staticmethod
+    def _load(column, value):
+        if column == "groups":
+            return tuple(g for g in (value or "").split(",") if g)
+        return value
+
+    def delete(self, task_id):
+        self._db.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def load(self):
+        """all stored rows as dicts"""
+        cursor = self._db.execute(
+            "SELECT {0} FROM tasks".format(", ".join(COLUMNS))
+        )
+        return [
+            dict((c, self._load(c, v)) for c, v in zip(COLUMNS, row))
+            for row in cursor
+        ]
+
+    def close(self):
+        self._db.close()
@@ -3,24 +3,41 @@ A Spawner for JupyterHub that runs each user's server in a separate docker
 container spun up by TES
 """
 
-import polling
+import hashlib
+import os
+import random
+import shlex
+import time
+
+from types import SimpleNamespace
 
 from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
 from jupyterhub.spawner import Spawner
 from traitlets import (
     Unicode,
     Integer,
+    Bool,
+    List,
+    Float,
+    Dict,
+    TraitError,
     default,
-    observe
-)
-from tes import (
-    Task,
-    TaskParameter,
-    Resources,
-    Ports,
-    Executor,
-    HTTPClient
+    observe,
+    validate
 )
+from tesspawner.cache import TaskStatusCache, TERMINAL_STATES
+from tesspawner.culler import IdleCuller
+from tesspawner.logs import TaskLogStore
+from tesspawner.profiler import profiled, start_profiling
+from tesspawner.quota import UsageLedger
+from tesspawner.store import TaskStore
+
+
+def _status_code(error):
+    """HTTP status of a failed TES request, None for other errors"""
+    return getattr(getattr(error, "response", None), "status_code", None)
 
 
 class TesSpawner(Spawner):
@@ -28,15 +45,234 @@ class TesSpawner(Spawner):
     start_timeout = Integer(300, config=True)
     endpoint = Unicode(help="TES server endpoint").tag(config=True)
     notebook_command = Unicode(
-        "bash /usr/local/bin/start-singleuser.sh"
-    ).tag(config=False)
+        "bash /usr/local/bin/start-singleuser.sh",
+        help="Command run by bash in the notebook executor"
+    ).tag(config=True)
+    profile_executors = Dict(
+        help="Extra executors per profile, keyed by image ('*' applies to"
+        " every profile). Each is a dict with 'command' and optionally"
+        " 'name' (default 'executor<N>', N counting the profile's specs),"
+        " 'when', 'image', 'workdir', 'stdout', 'stderr', 'env', 'ports',"
+        " 'volumes', and 'cpu' and 'mem' which are added to the task's"
+        " resources. 'when' is 'background' (default: started in the"
+        " notebook executor next to notebook_command, in the notebook image)"
+        " or 'before' or 'after' for a separate executor in its own 'image'"
+        " (required); TES runs executors in order, so 'before' delays the"
+        " notebook until it exits."
+    ).tag(config=True)
     task_id = Unicode().tag(config=False)
     status = Unicode().tag(config=False)
-    _client = None
+    respawns = Integer(0).tag(config=False)
+    # when and with which profile the task was submitted, for culling
+    task_created = Float(0).tag(config=False)
+    task_profile = Unicode().tag(config=False)
+    checkpointed = Bool(False).tag(config=False)
+    respawn_states = List(
+        ["SYSTEM_ERROR"],
+        help="Terminal task states caused by the infrastructure (preemption,"
+        " node failure) after which the task is resubmitted"
+    ).tag(config=True)
+    max_respawns = Integer(
+        2, help="Maximum number of automatic resubmissions per start"
+    ).tag(config=True)
+    checkpoint_url = Unicode(
+        "",
+        help="Storage URL the working directory is synced to on stop and"
+        " restored from on the next start, e.g."
+        " s3://bucket/checkpoints/{username}/{servername}."
+        " Empty disables checkpointing."
+    ).tag(config=True)
+    checkpoint_timeout = Integer(
+        120,
+        help="Seconds to wait for the checkpoint upload before cancelling"
+        " the task"
+    ).tag(config=True)
+    cull_idle_timeout = Integer(
+        0,
+        help="Cancel tasks whose user has been idle this long (seconds)."
+        " 0 disables idle culling."
+    ).tag(config=True)
+    cull_max_age = Integer(
+        0,
+        help="Cancel tasks older than this (seconds). 0 disables."
+    ).tag(config=True)
+    cull_profiles = Dict(
+        help="Per-profile culling policy, keyed by image, e.g."
+        " {'jupyter/tensorflow-notebook:latest': {'idle_timeout': 1800,"
+        " 'max_age': 86400}}"
+    ).tag(config=True)
+    cull_interval = Integer(
+        300, help="Interval (in seconds) between culling passes"
+    ).tag(config=True)
+    cull_batch_size = Integer(
+        10, help="Maximum number of servers stopped per culling batch"
+    ).tag(config=True)
+    cull_batch_delay = Integer(
+        5, help="Delay (in seconds) between culling batches"
+    ).tag(config=True)
+    cull_api_token = Unicode(
+        help="Admin hub API token used by the culler. Defaults to"
+        " $JUPYTERHUB_API_TOKEN."
+    ).tag(config=True)
+    log_buffer_lines = Integer(
+        1000, help="Number of executor log lines kept per task"
+    ).tag(config=True)
+    log_fetch_interval = Float(
+        2.0,
+        help="Minimum interval (in seconds) between executor log fetches"
+        " for the same task"
+    ).tag(config=True)
+    task_cache_path = Unicode(
+        "",
+        help="SQLite file the task status cache is persisted to, so a"
+        " restarted hub can answer polls before reaching TES."
+        " Empty disables persistence."
+    ).tag(config=True)
+    user_quota = Dict(
+        help="Default per-user limits on concurrent 'cpu' cores, 'mem' GB"
+        " and 'tasks', e.g. {'cpu': 8, 'mem': 64, 'tasks': 2}."
+        " Missing keys are unlimited."
+    ).tag(config=True)
+    user_quotas = Dict(
+        help="Per-user overrides of user_quota, keyed by user name"
+    ).tag(config=True)
+    group_quotas = Dict(
+        help="Limits shared by all members of a group, keyed by group name"
+    ).tag(config=True)
+    poll_intervals = Dict(
+        {
+            "QUEUED": [5, 15],
+            "INITIALIZING": [2, 10],
+            "RUNNING": [30, 600],
+            "*": [10, 60]
+        },
+        help="[min, max] seconds between TES status refreshes of a task, by"
+        " task state ('*' for any other state). A task is refreshed every"
+        " min seconds after its state changes; while the state stays the"
+        " same the interval grows by poll_backoff up to max. Hub polls in"
+        " between are answered from the cache."
+    ).tag(config=True)
+    poll_backoff = Float(
+        2.0, help="Growth factor of the refresh interval of a stable task"
+    ).tag(config=True)
+    poll_jitter = Float(
+        0.2,
+        help="Random fraction (+/-) applied to every refresh interval so"
+        " refreshes of tasks started together spread out"
+    ).tag(config=True)
+    poll_batch_window = Float(
+        5.0,
+        help="When one of a user's tasks is refreshed, the user's other"
+        " tasks due within this many seconds are refreshed with it"
+    ).tag(config=True)
+    profile_calls = Bool(
+        False,
+        help="Time every TES client call and spawner method and log a"
+        " rolling summary of the slowest calls"
+    ).tag(config=True)
+    profile_summary_interval = Integer(
+        300,
+        help="Interval (in seconds) between slow-call summaries in the log."
+        " 0 disables the summary."
+    ).tag(config=True)
+    stall_threshold = Float(
+        0,
+        help="With profile_calls, log a stack sample whenever the IOLoop is"
+        " blocked for longer than this many seconds. 0 disables."
+    ).tag(config=True)
+    _tes_client = None
+    # tes model classes task messages are built from, imported on first use
+    _tes_models = None
+    # shared by every spawner in the hub process
+    _task_cache = TaskStatusCache()
+    _log_store = TaskLogStore()
+    _ledger = UsageLedger(_task_cache)
+    _culler = None
+    _profiler = None
 
     @observe("endpoint")
     def init_client(self, change):
-        self._client = HTTPClient(change["new"])
+        # the client is created on first use so that loading the hub config
+        # does not import tes
+        self._tes_client = None
+
+    @property
+    def _client(self):
+        if self._tes_client is None:
+            from tes import HTTPClient
+            from tesspawner.client import TesClient
+            self._tes_client = TesClient(HTTPClient(self.endpoint))
+            profiler = self._get_profiler()
+            if profiler is not None:
+                self._tes_client = profiler.wrap(self._tes_client)
+        return self._tes_client
+
+    def _get_models(self):
+        """the tes model classes used in task messages"""
+        if self._tes_models is None:
+            try:
+                from tes import (
+                    Task, TaskParameter, Resources, Ports, Executor
+                )
+            except ImportError as e:
+                # TES 1.0 removed executor ports, which the notebook needs
+                raise ImportError(
+                    "TesSpawner needs py-tes < 0.2: {0}".format(e)
+                )
+            TesSpawner._tes_models = SimpleNamespace(
+                Task=Task, TaskParameter=TaskParameter, Resources=Resources,
+                Ports=Ports, Executor=Executor
+            )
+        return self._tes_models
+
+    def _get_profiler(self):
+        """the hub-wide call profiler, if profiling is enabled"""
+        if self.profile_calls and TesSpawner._profiler is None:
+            TesSpawner._profiler = start_profiling(
+                self.log,
+                stall_threshold=self.stall_threshold,
+                summary_interval=self.profile_summary_interval
+            )
+        return TesSpawner._profiler if self.profile_calls else None
+
+    @validate("profile_executors")
+    def _validate_profile_executors(self, proposal):
+        for profile, specs in proposal["value"].items():
+            for spec in specs:
+                when = spec.get("when", "background")
+                if when not in ("before", "background", "after"):
+                    raise TraitError(
+                        "Executor {0} of profile {1}: 'when' must be"
+                        " 'before', 'background' or 'after', not {2!r}".format(
+                            spec.get("name", ""), profile, when
+                        )
+                    )
+                if "command" not in spec:
+                    raise TraitError(
+                        "Executor {0} of profile {1} has no 'command'".format(
+                            spec.get("name", ""), profile
+                        )
+                    )
+                if when == "background" and "image" in spec:
+                    self.log.warning(
+                        "Executor {0} of profile {1} runs in the background"
+                        " of the notebook executor, its image {2} is"
+                        " ignored".format(
+                            spec.get("name", ""), profile, spec["image"]
+                        )
+                    )
+                elif when != "background" and "image" not in spec:
+                    raise TraitError(
+                        "Executor {0} of profile {1} runs {2} the notebook"
+                        " and needs an 'image'".format(
+                            spec.get("name", ""), profile, when
+                        )
+                    )
+        return proposal["value"]
+
+    @default("cull_api_token")
+    def _cull_api_token_default(self):
+        return os.environ.get("JUPYTERHUB_API_TOKEN", "")
 
     @default("options_form")
     def _options_form_default(self):
@@ -79,47 +315,203 @@ class TesSpawner(Spawner):
             "jupyter/datascience-notebook:latest",
             str
         )
+        self._validate_options(options)
         self.log.info("Parsed options: {}".format(options))
         return options
 
-    def _create_message(self):
-        """Generate a TES Task message"""
-        image = self._process_option(
+    def _validate_options(self, options):
+        """raise ValueError if a requested resource is not positive"""
+        for key, default_val, typef in (("cpu", 1, int), ("mem", 8, float),
+                                        ("disk", 10, float)):
+            value = self._process_option(options.get(key), default_val, typef)
+            if not value > 0:
+                raise ValueError(
+                    "{0} must be a positive number, not {1}".format(
+                        key, options.get(key)
+                    )
+                )
+
+    def _get_profile(self):
+        return self._process_option(
             self.user_options.get("image"),
             "jupyter/datascience-notebook:latest",
             str
         )
 
-        message = Task(
+    def _get_executor_specs(self):
+        """(before, background, after) lists of extra executor specs for
+        the profile"""
+        specs = [
+            dict(e, name=e.get("name", "executor{0}".format(i)))
+            for i, e in enumerate(
+                self.profile_executors.get("*", []) +
+                self.profile_executors.get(self._get_profile(), [])
+            )
+        ]
+        return tuple(
+            [e for e in specs if e.get("when", "background") == when]
+            for when in ("before", "background", "after")
+        )
+
+    def _get_cpu(self):
+        before, background, after = self._get_executor_specs()
+        return self._process_option(
+            self.user_options.get("cpu"), 1, int
+        ) + sum(int(e.get("cpu", 0)) for e in before + background + after)
+
+    def _get_mem(self):
+        before, background, after = self._get_executor_specs()
+        return self._process_option(
+            self.user_options.get("mem"), 8, float
+        ) + sum(float(e.get("mem", 0)) for e in before + background + after)
+
+    def _create_executor(self, spec):
+        """TES Executor for an extra executor spec"""
+        tes = self._get_models()
+
+        name = spec["name"]
+        cmd = spec["command"]
+        if not isinstance(cmd, list):
+            cmd = ["bash", "-c", cmd]
+        workdir = spec.get("workdir", "/home/jovyan/work")
+        return tes.Executor(
+            image_name=spec["image"],
+            cmd=cmd,
+            workdir=workdir,
+            stdout=spec.get("stdout", "{0}/{1}.stdout".format(workdir, name)),
+            stderr=spec.get("stderr", "{0}/{1}.stderr".format(workdir, name)),
+            ports=[
+                tes.Ports(host=0, container=p) for p in spec.get("ports", [])
+            ],
+            environ=spec.get("env", {})
+        )
+
+    def _get_notebook_command(self, background):
+        """notebook_command, preceded by the background specs so they run
+        while the notebook server starts"""
+        lines = []
+        for spec in background:
+            name = spec["name"]
+            workdir = spec.get("workdir", "/home/jovyan/work")
+            cmd = spec["command"]
+            if isinstance(cmd, list):
+                cmd = " ".join(shlex.quote(c) for c in cmd)
+            exports = "".join(
+                "export {0}={1}; ".format(k, shlex.quote(str(v)))
+                for k, v in sorted(spec.get("env", {}).items())
+            )
+            lines.append("(cd {0} && {1}{2}) >{3} 2>{4} &".format(
+                shlex.quote(workdir), exports, cmd,
+                shlex.quote(spec.get(
+                    "stdout", "{0}/{1}.stdout".format(workdir, name)
+                )),
+                shlex.quote(spec.get(
+                    "stderr", "{0}/{1}.stderr".format(workdir, name)
+                ))
+            ))
+        return "\n".join(lines + [self.notebook_command])
+
+    def _get_server_name(self):
+        # named servers need JupyterHub >= 0.8
+        return getattr(self, "name", "") or ""
+
+    def _get_server(self):
+        return getattr(self, "server", None) or self.user.server
+
+    def _get_key(self):
+        """idempotency key: one live task per user and server"""
+        return "{0}/{1}".format(self.user.name, self._get_server_name())
+
+    def _get_checkpoint_url(self):
+        return self.checkpoint_url.format(
+            username=self.user.name, servername=self._get_server_name()
+        )
+
+    def _get_groups(self):
+        return tuple(g.name for g in getattr(self.user, "groups", []))
+
+    def _check_quota(self):
+        """raise QuotaExceeded if this task would go over a quota"""
+        if not (self.user_quota or self.user_quotas or self.group_quotas):
+            return
+        self._ledger.check(
+            self.user.name,
+            self._get_groups(),
+            self._get_cpu(),
+            self._get_mem(),
+            self.user_quotas.get(self.user.name, self.user_quota),
+            self.group_quotas
+        )
+
+    def _create_message(self):
+        """Generate a TES Task message"""
+        tes = self._get_models()
+
+        image = self._get_profile()
+
+        inputs = []
+        outputs = []
+        if self.checkpoint_url:
+            checkpoint = tes.TaskParameter(
+                name="checkpoint",
+                url=self._get_checkpoint_url(),
+                path="/home/jovyan/work",
+                type="DIRECTORY"
+            )
+            # uploaded when the notebook exits cleanly
+            outputs.append(checkpoint)
+            if self.checkpointed:
+                inputs.append(checkpoint)
+
+        before, background, after = self._get_executor_specs()
+        volumes = []
+        for spec in before + background + after:
+            for v in spec.get("volumes", []):
+                if v not in volumes:
+                    volumes.append(v)
+
+        message = tes.Task(
             name=image,
-            inputs=[],
-            outputs=[],
-            resources=Resources(
-                cpu_cores=self._process_option(
-                    self.user_options.get("cpu"), 1, int
-                ),
-                ram_gb=self._process_option(
-                    self.user_options.get("mem"), 8, float
-                    ),
+            tags={
+                "jupyterhub_user": self.user.name,
+                "jupyterhub_server": self._get_server_name(),
+                "idempotency_key": self._get_key()
+            },
+            inputs=inputs,
+            outputs=outputs,
+            resources=tes.Resources(
+                cpu_cores=self._get_cpu(),
+                ram_gb=self._get_mem(),
                 size_gb=self._process_option(
                     self.user_options.get("disk"), 10, float
                 ),
             ),
+            volumes=volumes,
             executors=[
-                Executor(
+                self._create_executor(spec) for spec in before
+            ] + [
+                tes.Executor(
                     image_name=image,
-                    cmd=["bash", "-c", self.notebook_command],
+                    cmd=[
+                        "bash", "-c", self._get_notebook_command(background)
+                    ],
                     workdir="/home/jovyan/work",
                     stdout="/home/jovyan/work/stdout",
                     stderr="/home/jovyan/work/stderr",
                     ports=[
-                        Ports(
+                        tes.Ports(
                             host=0,
                             container=8888
                         )
+                    ] + [
+                        tes.Ports(host=0, container=p)
+                        for spec in background
+                        for p in spec.get("ports", [])
                     ],
                     environ=self._get_env()
                 )
+            ] + [
+                self._create_executor(spec) for spec in after
             ]
         )
 
@@ -130,8 +522,8 @@ class TesSpawner(Spawner):
         env = super(TesSpawner, self).get_env()
         env.update(dict(
             JPY_USER=self.user.name,
-            JPY_COOKIE_NAME=self.user.server.cookie_name,
-            JPY_BASE_URL=self.user.server.base_url,
+            JPY_COOKIE_NAME=self._get_server().cookie_name,
+            JPY_BASE_URL=self._get_server().base_url,
             JPY_HUB_PREFIX=self.hub.server.base_url,
             JPY_HUB_API_URL=self.hub.api_url
         ))
@@ -154,6 +546,33 @@ class TesSpawner(Spawner):
         super(TesSpawner, self).load_state(state)
         self.task_id = state.get("task_id", "")
         self.status = state.get("status", "")
+        self.respawns = state.get("respawns", 0)
+        self.checkpointed = state.get("checkpointed", False)
+        self.task_created = state.get("task_created", 0)
+        self.task_profile = state.get("task_profile", "")
+        if self.task_id:
+            self._open_task_store()
+            record = self._task_cache.get(self.task_id)
+            if record is None:
+                self._task_cache.update(
+                    self.task_id,
+                    user=self.user.name,
+                    server=self._get_server_name(),
+                    key=self._get_key(),
+                    groups=self._get_groups(),
+                    profile=self.task_profile or self._get_profile(),
+                    # user_options are restored before load_state
+                    cpu=self._get_cpu(),
+                    mem=self._get_mem(),
+                    created=self.task_created or None,
+                    state=self.status,
+                    endpoint=self.endpoint
+                )
+            elif record.state:
+                # the on-disk cache is fresher than the hub db
+                self.status = record.state
+            # the culler is otherwise only started by the next spawn
+            self._start_culler()
 
     def get_state(self):
         """add task_id to state"""
@@ -162,6 +581,14 @@ class TesSpawner(Spawner):
             state["task_id"] = self.task_id
         if self.status:
             state["status"] = self.status
+        if self.respawns:
+            state["respawns"] = self.respawns
+        if self.checkpointed:
+            state["checkpointed"] = self.checkpointed
+        if self.task_created:
+            state["task_created"] = self.task_created
+        if self.task_profile:
+            state["task_profile"] = self.task_profile
         return state
 
     def clear_state(self):
@@ -169,10 +596,42 @@ class TesSpawner(Spawner):
         super(TesSpawner, self).clear_state()
         self.task_id = ""
         self.status = ""
+        self.respawns = 0
+        self.task_created = 0
+        self.task_profile = ""
+        # checkpointed is kept so the next start restores the checkpoint
 
+    @profiled("spawner.start")
     @gen.coroutine
     def start(self):
         """Start the single-user server in a docker container via TES."""
+        self._open_task_store()
+
+        record = self._find_live_task()
+        if record is not None:
+            self.task_id = record.task_id
+            self.task_created = record.created or 0
+            self.task_profile = record.profile
+            self.log.info(
+                "Reusing TES job {0} for {1}".format(
+                    self.task_id, self._get_key()
+                )
+            )
+            if record.host_ip and record.port:
+                return (record.host_ip, record.port)
+        else:
+            self._submit()
+
+        ip, port = yield self._get_ip_and_port(self.start_timeout)
+        return (ip, port)
+
+    @profiled("spawner._submit")
+    def _submit(self):
+        """Create the notebook task"""
+        # user_options can also come from the REST API, bypassing the form;
+        # a negative request would lower the user's usage in the ledger
+        self._validate_options(self.user_options)
+        self._check_quota()
 
         # create task message defining notebook server
         message = self._create_message()
@@ -189,60 +648,466 @@ class TesSpawner(Spawner):
         self.log.info(
             "Started TES job: {0}".format(self.task_id)
         )
+        self.task_created = time.time()
+        self.task_profile = self._get_profile()
+        self._task_cache.update(
+            self.task_id,
+            user=self.user.name,
+            server=self._get_server_name(),
+            key=self._get_key(),
+            groups=self._get_groups(),
+            profile=self.task_profile,
+            cpu=self._get_cpu(),
+            mem=self._get_mem(),
+            created=self.task_created,
+            token_hash=self._get_token_hash(),
+            endpoint=self.endpoint
+        )
+        self._start_culler()
 
-        ip, port = self._get_ip_and_port(0)
-        return (ip, port)
+    def _find_live_task(self):
+        """a still running task submitted for this server with the current
+        options, if any
+
+        A live task started with other options or another API token (the
+        hub revokes the old one on stop) is cancelled.
+        """
+        record = self._task_cache.find(self._get_key())
+        if record is None:
+            return None
+        try:
+            state = self._fetch_state(record.task_id)
+        except Exception as e:
+            self.log.warning(
+                "Could not check TES job {0}: {1}".format(record.task_id, e)
+            )
+            return None
+        self._record_state(record.task_id, state)
+        if record.terminal:
+            return None
+        if (record.profile == self._get_profile() and
+                record.cpu == self._get_cpu() and
+                record.mem == self._get_mem() and
+                record.token_hash == self._get_token_hash()):
+            return record
+
+        self.log.info(
+            "Replacing TES job {0} of {1}, it was started with other"
+            " options".format(record.task_id, self._get_key())
+        )
+        try:
+            self._client.cancel_task(record.task_id)
+        except Exception as e:
+            self.log.warning(
+                "Cancelling job {0} failed: {1}".format(record.task_id, e)
+            )
+        self._task_cache.remove(record.task_id)
+        self._log_store.remove(record.task_id)
+        return None
+
+    def _get_token_hash(self):
+        """digest of the API token passed to the task, kept instead of the
+        token itself"""
+        return hashlib.sha256((self.api_token or "").encode()).hexdigest()
 
+    @profiled("spawner.poll")
     @gen.coroutine
     def poll(self):
-        terminal = ["COMPLETE", "ERROR", "SYSTEM_ERROR", "CANCELED"]
-        self._get_task_status()
+        record = self._task_cache.get(self.task_id)
+        if record is not None and record.restored:
+            # first poll after a restart: answer from the on-disk cache and
+            # reconcile with TES in the background
+            record.restored = False
+            self.status = record.state
+            IOLoop.current().spawn_callback(self._get_task_status)
+        else:
+            self._get_task_status()
 
         self.log.debug(
             "Job {0} status: {1}".format(self.task_id, self.status)
         )
 
-        if self.status not in terminal:
+        if (self.status in self.respawn_states and
+                self.respawns < self.max_respawns):
+            if self._respawn():
+                return None
+            # the hub treats the server as stopped
+            return 1
+
+        if self.status not in TERMINAL_STATES:
             return None
         else:
             return 1
 
+    def _respawn(self):
+        """Resubmit a task the backend lost, with the same user options
+
+        Only the submission happens here; the new address is picked up in
+        the background so poll() returns right away. Returns whether the
+        task was resubmitted; if not, the old task is left as it was.
+        """
+        old_task_id = self.task_id
+        self.log.warning(
+            "Job {0} ended in {1}, resubmitting ({2}/{3})".format(
+                old_task_id, self.status, self.respawns + 1,
+                self.max_respawns
+            )
+        )
+        try:
+            self._submit()
+        except Exception as e:
+            self.log.error(
+                "Resubmitting job {0} failed: {1}".format(old_task_id, e)
+            )
+            self.task_id = old_task_id
+            return False
+        self.respawns += 1
+        self._task_cache.remove(old_task_id)
+        self._log_store.remove(old_task_id)
+        self.status = ""
+        self._save_state()
+        IOLoop.current().spawn_callback(self._move_server, self.task_id)
+        return True
+
+    @gen.coroutine
+    def _move_server(self, task_id):
+        """point the hub's server record at a resubmitted task"""
+        try:
+            ip, port = yield self._get_ip_and_port(self.start_timeout)
+        except Exception as e:
+            self.log.warning(
+                "No address for resubmitted job {0}: {1}".format(task_id, e)
+            )
+            return
+        if task_id != self.task_id:
+            return
+
+        # the proxy route is brought in line with the server on the hub's
+        # next route check
+        server = self._get_server()
+        server.ip = ip
+        server.port = port
+        self._save_state()
+
+    def _save_state(self):
+        """write the spawner state to the hub db outside of start/stop"""
+        orm_spawner = getattr(self, "orm_spawner", None)
+        if orm_spawner is None:
+            return
+        from sqlalchemy import inspect
+
+        # the same session the hub loaded the spawner with
+        db = inspect(orm_spawner).session
+        orm_spawner.state = self.get_state()
+        if db is not None:
+            db.commit()
+
+    @profiled("spawner.stop")
     @gen.coroutine
     def stop(self, now=False):
         """Stop the TES worker"""
         if self.task_id != "":
+            if (self.checkpoint_url and not now and
+                    self.status not in TERMINAL_STATES):
+                yield self._checkpoint()
+            self._task_cache.remove(self.task_id)
+            self._log_store.remove(self.task_id)
+            if self.status in TERMINAL_STATES:
+                return
             return self._client.cancel_task(self.task_id)
         else:
             return
 
-    def _get_task_status(self):
+    def _get_address(self):
+        record = self._task_cache.get(self.task_id)
+        if record is not None and record.host_ip and record.port:
+            return record.host_ip, record.port
+        server = self._get_server()
+        return server.ip, server.port
+
+    @gen.coroutine
+    def _checkpoint(self):
+        """Shut the notebook down cleanly so TES uploads the working dir"""
+        ip, port = self._get_address()
+        url = "http://{0}:{1}{2}api/shutdown".format(
+            ip, port, self._get_server().base_url
+        )
+        try:
+            yield AsyncHTTPClient().fetch(HTTPRequest(
+                url,
+                method="POST",
+                body="",
+                headers={"Authorization": "token {0}".format(self.api_token)}
+            ))
+        except Exception as e:
+            self.log.warning(
+                "Checkpoint of job {0} failed: {1}".format(self.task_id, e)
+            )
+            return
+
+        deadline = time.time() + self.checkpoint_timeout
+        while time.time() < deadline:
+            self._get_task_status(force=True)
+            if self.status in TERMINAL_STATES:
+                break
+            yield gen.sleep(1)
+
+        if self.status == "COMPLETE":
+            self.checkpointed = True
+            self.log.info(
+                "Checkpointed job {0} to {1}".format(
+                    self.task_id, self._get_checkpoint_url()
+                )
+            )
+        else:
+            self.log.warning(
+                "Job {0} did not finish its checkpoint within {1}s".format(
+                    self.task_id, self.checkpoint_timeout
+                )
+            )
+
+    def get_logs(self, since=0, stream=None):
+        """Executor output of the current task
+
+        Returns (lines, next) where lines are the buffered lines with a
+        sequence number >= since and next is the `since` for the next call.
+        """
+        if self.task_id == "":
+            return [], since
+        tail = self._get_log_tail(self.task_id)
+        if tail.stale():
+            tail.update(self._client.get_task(self.task_id, "FULL"))
+        return tail.read(since, stream)
+
+    def _get_log_tail(self, task_id):
+        return self._log_store.get(
+            task_id,
+            max_lines=self.log_buffer_lines,
+            min_interval=self.log_fetch_interval
+        )
+
+    async def progress(self):
+        """Stream executor output to the spawn-progress page
+
+        While the spawn waits for an address the tail is kept current by
+        _get_ip_and_port, so this only reads the buffer.
+        """
+        steps = {"QUEUED": 20, "INITIALIZING": 40, "RUNNING": 80}
+        since = 0
+        while True:
+            if self.task_id:
+                record = self._task_cache.get(self.task_id)
+                state = record.state if record is not None else self.status
+                lines, since = self.get_logs(since)
+                for line in lines:
+                    yield {
+                        "progress": steps.get(state, 10),
+                        "message": "[{stream}] {line}".format(**line)
+                    }
+            await gen.sleep(self.log_fetch_interval)
+
+    def _open_task_store(self):
+        """attach the on-disk store to the shared cache once per process"""
+        if not self.task_cache_path or self._task_cache.store is not None:
+            return
+        self._task_cache.attach(TaskStore(self.task_cache_path))
+        self.log.info(
+            "Restored {0} TES tasks from {1}".format(
+                len(self._task_cache), self.task_cache_path
+            )
+        )
+        IOLoop.current().spawn_callback(self._reconcile_restored)
+
+    @gen.coroutine
+    def _reconcile_restored(self):
+        """check every task restored from disk against TES
+
+        Records whose spawner is loaded are also confirmed by its polls, but
+        the others (e.g. servers removed while the hub was down) would stay
+        in the cache and count against quotas. Tasks TES no longer knows or
+        that have ended are dropped.
+        """
+        for record in self._task_cache.records():
+            if not record.restored or record.endpoint not in ("",
+                                                              self.endpoint):
+                continue
+            try:
+                state = self._fetch_state(record.task_id)
+            except Exception as e:
+                self.log.warning(
+                    "Could not check restored TES tasks: {0}".format(e)
+                )
+                return
+            self._record_state(record.task_id, state)
+            if record.terminal:
+                # a spawner still tracking it refetches it on its poll
+                self._task_cache.remove(record.task_id)
+            # let the hub handle requests between checks
+            yield gen.moment
+
+    def _start_culler(self):
+        """start the hub-wide idle culler if any policy is configured"""
+        enabled = (self.cull_idle_timeout or self.cull_max_age or
+                   self.cull_profiles)
+        if TesSpawner._culler is not None or not enabled:
+            return
+        if not self.cull_api_token:
+            self.log.warning("Idle culling requires cull_api_token")
+            return
+        TesSpawner._culler = IdleCuller(
+            self._task_cache,
+            self.hub.api_url,
+            self.cull_api_token,
+            self.log,
+            idle_timeout=self.cull_idle_timeout,
+            max_age=self.cull_max_age,
+            profile_policies=self.cull_profiles,
+            interval=self.cull_interval,
+            batch_size=self.cull_batch_size,
+            batch_delay=self.cull_batch_delay
+        )
+        TesSpawner._culler.start()
+
+    def _get_task_status(self, force=False):
         if self.task_id == "":
             # job not running
             self.status = ""
             return self.status
 
-        response = self._client.get_task(self.task_id, "MINIMAL")
-        self.status = response.state
+        record = self._task_cache.get(self.task_id)
+        if force or record is None or self._is_stale(record):
+            self._refresh_tasks()
+            record = self._task_cache.get(self.task_id)
+        self.status = record.state
         return
 
-    def _get_ip_and_port(self, timeout=60):
+    def _is_stale(self, record, now=None, window=0):
+        """whether record is due for a refresh within window seconds"""
+        if record.checked is None or record.next_check is None:
+            return True
+        if now is None:
+            now = time.time()
+        return now + window >= record.next_check
+
+    def _record_state(self, task_id, state):
+        """store a state fetched from TES and schedule the next refresh"""
+        record = self._task_cache.get(task_id)
+        low, high = self.poll_intervals.get(
+            state, self.poll_intervals.get("*", [10, 60])
+        )
+        if record is None or record.state != state or not record.interval:
+            interval = low
+        else:
+            interval = min(max(record.interval * self.poll_backoff, low), high)
+        now = time.time()
+        jitter = random.uniform(-self.poll_jitter, self.poll_jitter)
+        self._task_cache.update(
+            task_id,
+            state=state,
+            checked=now,
+            interval=interval,
+            next_check=now + interval * (1 + jitter),
+            restored=False
+        )
+
+    @profiled("spawner._refresh_tasks")
+    def _refresh_tasks(self):
+        """fetch the state of this task and the user's other tasks that are
+        due within poll_batch_window
+
+        Polls of the user's other servers are then answered from the cache.
+        Several tasks are fetched with one listing filtered by the
+        jupyterhub_user tag; tasks the listing misses are fetched one by one.
+        """
+        now = time.time()
+        task_ids = [self.task_id] + [
+            r.task_id for r in self._task_cache.records(self.user.name)
+            if r.task_id != self.task_id and not r.terminal and
+            self._is_stale(r, now, self.poll_batch_window)
+        ]
+        states = {}
+        if len(task_ids) > 1:
+            try:
+                states = self._client.get_task_states(
+                    "jupyterhub_user", self.user.name, task_ids
+                )
+            except Exception as e:
+                self.log.debug(
+                    "Listing tasks of {0} failed: {1}".format(
+                        self.user.name, e
+                    )
+                )
+        for task_id in task_ids:
+            if task_id not in states:
+                try:
+                    states[task_id] = self._fetch_state(task_id)
+                except Exception as e:
+                    if task_id == self.task_id:
+                        raise
+                    # retried on the poll of the task's own server
+                    self.log.warning(
+                        "Refreshing job {0} failed: {1}".format(task_id, e)
+                    )
+                    continue
+            self._record_state(task_id, states[task_id])
+
+    def _fetch_state(self, task_id):
+        """state of a task from TES
+
+        A task TES no longer knows (e.g. purged from its database) is
+        reported as SYSTEM_ERROR, so it is handled like a lost task.
+        """
+        try:
+            return self._client.get_task(task_id, "MINIMAL").state
+        except Exception as e:
+            if _status_code(e) != 404:
+                raise
+            self.log.warning("TES no longer knows job {0}".format(task_id))
+            return "SYSTEM_ERROR"
+
+    @profiled("spawner._get_ip_and_port")
+    @gen.coroutine
+    def _get_ip_and_port(self, timeout=60, step=0.5):
+        """wait for the notebook executor of the current task to report its
+        address, giving up after timeout seconds"""
+        task_id = self.task_id
+        # the notebook runs after the extra executors scheduled before it
+        i = len(self._get_executor_specs()[0])
+
         def check_success(r):
             if r.logs is not None:
-                if r.logs[0].logs is not None:
-                    s1 = r.logs[0].logs[0].host_ip is not None
-                    s2 = r.logs[0].logs[0].ports is not None
+                if r.logs[0].logs is not None and len(r.logs[0].logs) > i:
+                    s1 = r.logs[0].logs[i].host_ip is not None
+                    s2 = r.logs[0].logs[i].ports is not None
                     if s1 and s2:
-                        if r.logs[0].logs[0].ports[0].host is not None:
+                        if r.logs[0].logs[i].ports[0].host is not None:
                             return True
             return False
 
-        r = polling.poll(
-            lambda: self._client.get_task(self.task_id, "FULL"),
-            check_success=check_success,
-            step=0.1,
-            timeout=timeout
-        )
+        deadline = time.time() + timeout
+        while True:
+            r = self._client.get_task(task_id, "FULL")
+            # the FULL view carries the state and the executor output, so
+            # progress() can report both without fetching it again
+            self._record_state(task_id, r.state)
+            self._get_log_tail(task_id).update(r)
+            if check_success(r):
+                break
+            if r.state in TERMINAL_STATES:
+                raise RuntimeError(
+                    "Job {0} ended in {1} before it had an address".format(
+                        task_id, r.state
+                    )
+                )
+            if time.time() >= deadline:
+                raise TimeoutError(
+                    "Job {0} had no address after {1}s".format(
+                        task_id, timeout
+                    )
+                )
+            yield gen.sleep(step)
 
-        ip = r.logs[0].logs[0].host_ip
-        port = r.logs[0].logs[0].ports[0].host
+        ip = r.logs[0].logs[i].host_ip
+        port = r.logs[0].logs[i].ports[0].host
+        self._task_cache.update(task_id, host_ip=ip, port=port)
         return ip, port
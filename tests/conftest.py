@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tesspawner.cache import TaskStatusCache
+from tesspawner.loadtest import FAKE_MODELS, FakeTESClient
+from tesspawner.logs import TaskLogStore
+from tesspawner.quota import UsageLedger
+from tesspawner.tesspawner import TesSpawner
+
+
+@pytest.fixture(autouse=True)
+def shared_state(monkeypatch):
+    """fresh hub-wide cache, ledger, log store and culler for every test"""
+    cache = TaskStatusCache()
+    monkeypatch.setattr(TesSpawner, "_task_cache", cache)
+    monkeypatch.setattr(TesSpawner, "_ledger", UsageLedger(cache))
+    monkeypatch.setattr(TesSpawner, "_log_store", TaskLogStore())
+    monkeypatch.setattr(TesSpawner, "_culler", None)
+    yield cache
+    if TesSpawner._culler is not None:
+        TesSpawner._culler.stop()
+
+
+@pytest.fixture
+def tes():
+    """in-memory TES whose tasks run as soon as they are created"""
+    return FakeTESClient(latency=0, queue_delay=0)
+
+
+@pytest.fixture
+def make_spawner(tes):
+    def make(name="alice", groups=(), user_options=None, **kwargs):
+        server = SimpleNamespace(
+            ip="", port=0, cookie_name="jupyter-hub-token-" + name,
+            base_url="/user/{0}/".format(name)
+        )
+        user = SimpleNamespace(
+            name=name, escaped_name=name, server=server,
+            url="/user/{0}/".format(name),
+            groups=[SimpleNamespace(name=g) for g in groups]
+        )
+        hub = SimpleNamespace(
+            server=SimpleNamespace(base_url="/hub/"), base_url="/hub/",
+            api_url="http://127.0.0.1:8081/hub/api", public_host="",
+            url="http://127.0.0.1:8081/hub/"
+        )
+        spawner = TesSpawner(user=user, hub=hub, **kwargs)
+        spawner.user_options = user_options or {}
+        spawner._tes_client = tes
+        spawner._tes_models = FAKE_MODELS
+        return spawner
+    return make
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tesspawner.client import TesClient
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setattr(TesClient, "unfiltered", set())
+
+    def make(tasks, next_page_token=None, page_size=3):
+        client = TesClient(SimpleNamespace(url="http://tes"), page_size)
+        client.requests = []
+
+        def list_tasks(params):
+            client.requests.append(dict(params))
+            return {"tasks": tasks, "next_page_token": next_page_token}
+        client._list = list_tasks
+        return client
+    return make
+
+
+def test_filtered_listing(make_client):
+    client = make_client([{"id": "a", "state": "RUNNING"},
+                          {"id": "old", "state": "COMPLETE"}])
+    states = client.get_task_states("jupyterhub_user", "alice", ["a", "b"])
+    assert states == {"a": "RUNNING"}
+    params, = client.requests
+    assert params["tag_key"] == "jupyterhub_user"
+    assert params["tag_value"] == "alice"
+    assert "page_token" not in params
+
+    # a short page means the filter works, so it keeps being used
+    client.get_task_states("jupyterhub_user", "alice", ["b"])
+    assert len(client.requests) == 2
+
+
+def test_ignored_filter_stops_the_listing(make_client):
+    client = make_client([{"id": "x", "state": "RUNNING"},
+                          {"id": "y", "state": "RUNNING"}],
+                         next_page_token="p2")
+    assert client.get_task_states("jupyterhub_user", "alice", ["a"]) == {}
+    # one page only, and none at all afterwards, for any client of the
+    # same server
+    assert len(client.requests) == 1
+    other = make_client([])
+    assert other.get_task_states("jupyterhub_user", "bob", ["b"]) == {}
+    assert other.requests == []
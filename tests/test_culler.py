@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import time
+
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from tesspawner import culler as culler_module
+from tesspawner.cache import TaskStatusCache
+from tesspawner.culler import IdleCuller
+from tesspawner.tesspawner import TesSpawner
+
+
+def make_culler(cache, **kwargs):
+    return IdleCuller(cache, "http://hub/api", "secret",
+                      logging.getLogger("test"), **kwargs)
+
+
+def add_task(cache, task_id, user, server="", created=None, profile=""):
+    cache.update(task_id, user=user, server=server, state="RUNNING",
+                 profile=profile, created=created or time.time())
+
+
+def test_idle_and_old_tasks_are_culled():
+    now = time.time()
+    cache = TaskStatusCache()
+    add_task(cache, "t1", "alice", created=now - 50)
+    add_task(cache, "t2", "bob", created=now - 50)
+    add_task(cache, "t3", "carol", created=now - 500)
+    culler = make_culler(cache, idle_timeout=100, max_age=400)
+    activity = {"alice": now - 200, "bob": now - 10, "carol": now}
+    assert sorted(culler.find_idle(activity, now)) == [
+        ("alice", ""), ("carol", "")
+    ]
+
+
+def test_activity_is_matched_per_server():
+    now = time.time()
+    cache = TaskStatusCache()
+    add_task(cache, "t1", "alice", "a", created=now - 500)
+    add_task(cache, "t2", "alice", "b", created=now - 500)
+    culler = make_culler(cache, idle_timeout=100)
+    activity = {"alice": now, ("alice", "a"): now - 200,
+                ("alice", "b"): now - 10}
+    assert culler.find_idle(activity, now) == [("alice", "a")]
+
+
+def test_tasks_without_activity_are_not_idle():
+    now = time.time()
+    cache = TaskStatusCache()
+    add_task(cache, "t1", "alice", "a", created=now - 500)
+    add_task(cache, "t2", "alice", "b", created=now - 500, profile="small")
+    culler = make_culler(cache, idle_timeout=100,
+                         profile_policies={"small": {"max_age": 400}})
+    assert culler.find_idle({}, now) == [("alice", "b")]
+
+
+def test_users_are_listed_page_by_page(monkeypatch):
+    pages = {
+        0: {"items": [{"name": "u0", "last_activity": None}],
+            "_pagination": {"next": {"offset": 1}}},
+        1: {"items": [{"name": "u1", "last_activity": None}],
+            "_pagination": {"next": None}}
+    }
+    urls = []
+
+    class FakeHTTPClient(object):
+        async def fetch(self, request):
+            urls.append(request.url)
+            query = parse_qs(urlparse(request.url).query)
+            page = pages[int(query["offset"][0])]
+            return SimpleNamespace(body=json.dumps(page).encode())
+
+    monkeypatch.setattr(culler_module, "AsyncHTTPClient", FakeHTTPClient)
+    culler = make_culler(TaskStatusCache())
+
+    async def fetch_activity():
+        return await culler._user_activity()
+
+    activity = asyncio.run(fetch_activity())
+    assert sorted(activity) == ["u0", "u1"]
+    assert len(urls) == 2
+
+
+def test_task_state_round_trip(make_spawner):
+    spawner = make_spawner()
+    state = {"task_id": "t1", "status": "RUNNING", "respawns": 1,
+             "task_created": 1000.0, "task_profile": "img"}
+    spawner.load_state(state)
+    assert spawner.get_state() == state
+
+    spawner.clear_state()
+    assert spawner.get_state() == {}
+
+
+def test_culling_policy_survives_restart(make_spawner):
+    async def restore():
+        spawner = make_spawner(
+            cull_profiles={"img": {"max_age": 100}},
+            cull_api_token="secret"
+        )
+        spawner.load_state({
+            "task_id": "t1", "status": "RUNNING",
+            "task_created": time.time() - 200, "task_profile": "img"
+        })
+        return spawner
+
+    spawner = asyncio.run(restore())
+    assert spawner._task_cache.get("t1").profile == "img"
+
+    culler = TesSpawner._culler
+    assert culler is not None
+    assert culler.find_idle({}) == [("alice", "")]
@@ -0,0 +1,27 @@
+import asyncio
+
+from tesspawner.loadtest import (
+    FAKE_MODELS, CountingClient, FakeTESClient, LoadTest
+)
+
+
+def test_broken_events_do_not_stall_the_run():
+    events = [{"t": 0, "user": "alice"}, {"user": "bob"},
+              {"t": 0, "user": "carol", "formdata": {"cpu": ["-1"]}}]
+    test = LoadTest(events, CountingClient(FakeTESClient(0, 0)),
+                    poll_interval=0.05, models=FAKE_MODELS)
+
+    async def run():
+        await asyncio.wait_for(test.run(), timeout=10)
+
+    asyncio.run(run())
+    report = test.report()
+    assert report["spawns"] == 3
+    assert report["failed"] == 2
+    assert report["elapsed"] >= report["duration"]
+    assert report["tes_requests"]["cancel_task"]["count"] == 1
+
+
+def test_report_before_run():
+    report = LoadTest([], CountingClient(FakeTESClient())).report()
+    assert report["throughput"] == 0
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tornado import web
+
+from tesspawner.handlers import _int_argument
+from tesspawner.logs import TaskLogTail
+
+
+def full_view(*executors):
+    """a FULL task view with one attempt and an executor log per
+    (stdout, stderr) pair"""
+    return SimpleNamespace(logs=[SimpleNamespace(logs=[
+        SimpleNamespace(stdout=out, stderr=err) for out, err in executors
+    ])])
+
+
+def lines(tail, **kwargs):
+    return [(l["executor"], l["stream"], l["line"])
+            for l in tail.read(**kwargs)[0]]
+
+
+def test_executors_are_tailed_separately():
+    tail = TaskLogTail("t1")
+    tail.update(full_view(("a1\na2\n", ""), ("b1\n", "e1\n")))
+    tail.update(full_view(("a1\na2\na3\n", ""), ("b1\nb2\n", "e1\n")))
+    assert lines(tail) == [
+        (0, "stdout", "a1"), (0, "stdout", "a2"),
+        (1, "stdout", "b1"), (1, "stderr", "e1"),
+        (0, "stdout", "a3"), (1, "stdout", "b2")
+    ]
+
+
+def test_partial_lines_wait_for_their_newline():
+    tail = TaskLogTail("t1")
+    key = (0, 0, "stdout")
+    assert tail.feed(key, "one\ntw") == 1
+    assert tail.feed(key, "one\ntwo\n") == 1
+    assert [l["line"] for l in tail.read()[0]] == ["one", "two"]
+
+
+def test_shifted_tail_of_the_same_size():
+    tail = TaskLogTail("t1")
+    key = (0, 0, "stdout")
+    tail.feed(key, "l1\nl2\nl3\n")
+    # the backend only keeps the last three lines
+    tail.feed(key, "l2\nl3\nl4\n")
+    tail.feed(key, "l4\nl5\nl6\n")
+    assert [l["line"] for l in tail.read()[0]] == [
+        "l1", "l2", "l3", "l4", "l5", "l6"
+    ]
+
+
+def test_truncated_log_starts_over():
+    tail = TaskLogTail("t1")
+    key = (0, 0, "stdout")
+    tail.feed(key, "old\n")
+    tail.feed(key, "new\n")
+    assert [l["line"] for l in tail.read()[0]] == ["old", "new"]
+
+
+def test_read_since_and_stream():
+    tail = TaskLogTail("t1", max_lines=2)
+    tail.update(full_view(("1\n2\n3\n", "err\n")))
+    assert lines(tail) == [(0, "stdout", "3"), (0, "stderr", "err")]
+    assert lines(tail, stream="stderr") == [(0, "stderr", "err")]
+    _, since = tail.read()
+    assert tail.read(since)[0] == []
+
+
+def test_since_must_be_an_integer():
+    def handler(**args):
+        return SimpleNamespace(get_argument=lambda name, default: args.get(
+            name, default
+        ))
+
+    assert _int_argument(handler(), "since", 0) == 0
+    assert _int_argument(handler(since="12"), "since", 0) == 12
+    with pytest.raises(web.HTTPError) as e:
+        _int_argument(handler(since="x"), "since", 0)
+    assert e.value.status_code == 400
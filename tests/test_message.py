@@ -0,0 +1,64 @@
+import subprocess
+
+import pytest
+
+from traitlets import TraitError
+
+
+def test_executors_run_in_order(make_spawner):
+    spawner = make_spawner(
+        user_options={"cpu": 2, "mem": 4},
+        profile_executors={"*": [
+            {"command": "fetch", "volumes": ["/cache"], "cpu": 1},
+            {"command": "warm", "when": "before", "image": "tools"},
+            {"name": "upload", "command": "up", "when": "after",
+             "image": "tools", "mem": 2}
+        ]}
+    )
+    message = spawner._create_message()
+    images = [e.image_name for e in message.executors]
+    assert images == ["tools", "jupyter/datascience-notebook:latest",
+                      "tools"]
+    assert message.executors[0].stdout == "/home/jovyan/work/executor1.stdout"
+    assert message.executors[2].stdout == "/home/jovyan/work/upload.stdout"
+    assert message.volumes == ["/cache"]
+    assert message.resources.cpu_cores == 3
+    assert message.resources.ram_gb == 6
+
+    notebook = message.executors[1].cmd[2]
+    assert "executor0.stdout" in notebook
+    assert notebook.endswith(spawner.notebook_command)
+
+
+def test_background_commands_are_quoted(make_spawner, tmp_path):
+    payload = "it's $HOME; echo no"
+    spawner = make_spawner(
+        notebook_command="wait",
+        profile_executors={"*": [{
+            "name": "echo",
+            "command": ["printf", "%s|%s", payload],
+            "env": {"VALUE": payload},
+            "workdir": str(tmp_path)
+        }, {
+            "name": "env",
+            "command": 'printf %s "$VALUE"',
+            "env": {"VALUE": payload},
+            "workdir": str(tmp_path)
+        }]}
+    )
+    command = spawner._get_notebook_command(
+        spawner._get_executor_specs()[1]
+    )
+    subprocess.check_call(["bash", "-c", command])
+    assert (tmp_path / "echo.stdout").read_text() == payload + "|"
+    assert (tmp_path / "env.stdout").read_text() == payload
+
+
+@pytest.mark.parametrize("spec", [
+    {"command": "x", "when": "sidecar"},
+    {"when": "before", "image": "tools"},
+    {"command": "x", "when": "after"}
+])
+def test_invalid_specs_are_rejected(make_spawner, spec):
+    with pytest.raises(TraitError):
+        make_spawner(profile_executors={"*": [spec]})
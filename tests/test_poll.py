@@ -0,0 +1,37 @@
+def test_record_state_backs_off_while_state_is_stable(make_spawner):
+    spawner = make_spawner(
+        poll_intervals={"RUNNING": [30, 200], "*": [5, 10]},
+        poll_backoff=2.0,
+        poll_jitter=0
+    )
+    intervals = []
+    for _ in range(5):
+        spawner._record_state("t1", "RUNNING")
+        intervals.append(spawner._task_cache.get("t1").interval)
+    assert intervals == [30, 60, 120, 200, 200]
+
+    # a state change starts over at the new state's minimum
+    spawner._record_state("t1", "COMPLETE")
+    assert spawner._task_cache.get("t1").interval == 5
+
+
+def test_record_state_jitter(make_spawner):
+    spawner = make_spawner(
+        poll_intervals={"QUEUED": [10, 10]}, poll_jitter=0.2
+    )
+    delays = []
+    for i in range(50):
+        spawner._record_state("t{0}".format(i), "QUEUED")
+        record = spawner._task_cache.get("t{0}".format(i))
+        delays.append(record.next_check - record.checked)
+    assert all(8 <= d <= 12 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_stale_records_are_refreshed(make_spawner):
+    spawner = make_spawner(poll_intervals={"*": [10, 10]}, poll_jitter=0)
+    spawner._record_state("t1", "RUNNING")
+    record = spawner._task_cache.get("t1")
+    assert not spawner._is_stale(record)
+    assert spawner._is_stale(record, window=10)
+    assert spawner._is_stale(record, now=record.checked + 10)
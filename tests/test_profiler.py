@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+from tornado import gen
+
+from tesspawner.profiler import CallProfiler, StallDetector, profiled
+
+
+class Timed(object):
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+
+    def _get_profiler(self):
+        return self.profiler
+
+    @profiled("timed.call")
+    def call(self, value):
+        return value
+
+    @profiled("timed.wait")
+    @gen.coroutine
+    def wait(self, seconds):
+        yield gen.sleep(seconds)
+        return seconds
+
+
+def test_calls_and_coroutines_are_timed():
+    profiler = CallProfiler()
+    timed = Timed(profiler)
+    assert timed.call(1) == 1
+
+    async def wait():
+        return await timed.wait(0.05)
+
+    assert asyncio.run(wait()) == 0.05
+    calls = profiler.summary()["calls"]
+    assert calls["timed.call"]["count"] == 1
+    # the coroutine is timed until it finishes, not until it yields
+    assert calls["timed.wait"]["max"] >= 0.05
+
+
+def test_profiling_off():
+    assert Timed().call(2) == 2
+
+
+def test_client_calls_are_timed():
+    profiler = CallProfiler()
+    client = profiler.wrap(Timed())
+    client.call(3)
+    assert list(profiler.summary()["calls"]) == ["tes.call"]
+
+
+def test_summary_keeps_the_slowest_calls():
+    profiler = CallProfiler()
+    for duration in (0.1, 0.3, 0.2):
+        profiler.record("tes.get_task", duration)
+    summary = profiler.summary(top=2)
+    assert summary["calls"]["tes.get_task"] == {
+        "count": 3, "total": 0.1 + 0.3 + 0.2, "p50": 0.2, "max": 0.3
+    }
+    assert [c["duration"] for c in summary["slowest"]] == [0.3, 0.2]
+    assert "tes.get_task: 3 calls" in profiler.format_summary()
+
+
+def test_stalls_are_reported(caplog):
+    profiler = CallProfiler()
+    detector = StallDetector(logging.getLogger("test"), threshold=0.1,
+                             interval=0.02, profiler=profiler)
+
+    async def stall():
+        detector.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+        detector.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(stall())
+    assert "IOLoop stalled" in caplog.text
+    assert "in stall" in caplog.text
+    assert profiler.summary()["calls"]["ioloop.stall"]["max"] >= 0.2
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from tesspawner.quota import QuotaExceeded
+
+
+def test_restored_tasks_count_against_quotas(make_spawner):
+    options = {"cpu": 4, "mem": 16}
+    spawner = make_spawner(groups=["lab"], user_options=options)
+    spawner.load_state({"task_id": "t1", "status": "RUNNING"})
+
+    ledger = spawner._ledger
+    assert ledger.user_usage("alice") == {"cpu": 4, "mem": 16.0, "tasks": 1}
+    assert ledger.group_usage("lab") == {"cpu": 4, "mem": 16.0, "tasks": 1}
+
+    other = make_spawner(
+        groups=["lab"], user_options=options, user_quota={"cpu": 6}
+    )
+    with pytest.raises(QuotaExceeded):
+        other._check_quota()
+
+
+@pytest.mark.parametrize("field,value", [
+    ("cpu", "0"), ("cpu", "-3"), ("mem", "-8"), ("disk", "0"), ("mem", "nan")
+])
+def test_form_rejects_non_positive_resources(make_spawner, field, value):
+    spawner = make_spawner()
+    with pytest.raises(ValueError):
+        spawner.options_from_form({field: [value]})
+
+
+def test_negative_request_cannot_lower_usage(make_spawner, tes):
+    spawner = make_spawner(user_options={"mem": -100},
+                           user_quota={"mem": 16})
+
+    async def start():
+        return await spawner.start()
+
+    with pytest.raises(ValueError):
+        asyncio.run(start())
+    assert tes._tasks == {}
+    assert spawner._ledger.user_usage("alice")["mem"] == 0
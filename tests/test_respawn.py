@@ -0,0 +1,75 @@
+import asyncio
+
+from tornado import gen
+
+
+def run(make_coro):
+    async def main():
+        return await make_coro()
+    return asyncio.run(main())
+
+
+def lose_task(spawner, tes):
+    """have the backend drop the spawner's task and make its cached state
+    due for a refresh"""
+    tes._tasks[spawner.task_id]["state"] = "SYSTEM_ERROR"
+    spawner._task_cache.get(spawner.task_id).next_check = 0
+
+
+def test_lost_task_is_resubmitted(make_spawner, tes):
+    spawner = make_spawner()
+
+    async def scenario():
+        ip, port = await spawner.start()
+        spawner._get_server().ip, spawner._get_server().port = ip, port
+        old_task_id = spawner.task_id
+        lose_task(spawner, tes)
+
+        status = await spawner.poll()
+        assert status is None
+        assert spawner.task_id != old_task_id
+        assert spawner.respawns == 1
+        assert spawner.get_state()["task_id"] == spawner.task_id
+        assert old_task_id not in spawner._task_cache
+
+        # the new address is picked up in the background
+        await gen.sleep(0.1)
+        return port
+
+    old_port = run(scenario)
+    assert spawner._get_server().port == tes._tasks[spawner.task_id]["port"]
+    assert spawner._get_server().port != old_port
+
+
+def test_failed_resubmission_stops_the_server(make_spawner, tes):
+    spawner = make_spawner()
+
+    def unavailable(message):
+        raise RuntimeError("TES is down")
+
+    async def scenario():
+        await spawner.start()
+        old_task_id = spawner.task_id
+        lose_task(spawner, tes)
+        tes.create_task = unavailable
+
+        assert await spawner.poll() == 1
+        assert spawner.task_id == old_task_id
+        assert spawner.respawns == 0
+        assert spawner._task_cache.get(old_task_id).state == "SYSTEM_ERROR"
+
+    run(scenario)
+
+
+def test_respawns_are_limited(make_spawner, tes):
+    spawner = make_spawner(max_respawns=1)
+
+    async def scenario():
+        await spawner.start()
+        lose_task(spawner, tes)
+        assert await spawner.poll() is None
+        await gen.sleep(0.1)
+        lose_task(spawner, tes)
+        assert await spawner.poll() == 1
+
+    run(scenario)
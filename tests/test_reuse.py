@@ -0,0 +1,60 @@
+import asyncio
+
+from types import SimpleNamespace
+
+
+def run(make_coro):
+    async def main():
+        return await make_coro()
+    return asyncio.run(main())
+
+
+def test_live_task_with_the_same_options_is_reused(make_spawner):
+    options = {"cpu": 2, "mem": 4}
+    first = make_spawner(user_options=options, api_token="token")
+    run(first.start)
+
+    # the hub lost track of the server but spawns it again in the same
+    # spawn, with the same token
+    second = make_spawner(user_options=options, api_token="token")
+    run(second.start)
+    assert second.task_id == first.task_id
+
+
+def test_live_task_with_other_options_is_replaced(make_spawner, tes):
+    first = make_spawner(user_options={"cpu": 2}, api_token="token")
+    run(first.start)
+
+    for kwargs in ({"user_options": {"cpu": 4}, "api_token": "token"},
+                   {"user_options": {"cpu": 2}, "api_token": "new"}):
+        old_task_id = first.task_id
+        first = make_spawner(**kwargs)
+        run(first.start)
+        assert first.task_id != old_task_id
+        assert tes._tasks[old_task_id]["state"] == "CANCELED"
+
+
+def test_purged_cached_task_is_not_reused(make_spawner, tes):
+    first = make_spawner()
+    run(first.start)
+    del tes._tasks[first.task_id]
+
+    second = make_spawner()
+    run(second.start)
+    assert second.task_id != first.task_id
+
+
+def test_purged_task_of_another_server(make_spawner, tes):
+    small = make_spawner()
+    big = make_spawner(orm_spawner=SimpleNamespace(name="big", server=None))
+
+    async def scenario():
+        await small.start()
+        await big.start()
+        del tes._tasks[big.task_id]
+        for spawner in (small, big):
+            small._task_cache.get(spawner.task_id).next_check = 0
+        assert await small.poll() is None
+
+    run(scenario)
+    assert small._task_cache.get(big.task_id).state == "SYSTEM_ERROR"
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+
+from tesspawner.cache import TaskRecord, TaskStatusCache
+from tesspawner.store import TaskStore
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    record = TaskRecord("t1")
+    for k, v in dict(endpoint="http://tes", state="RUNNING", user="alice",
+                     server="gpu", key="alice/gpu", groups=("lab", "ops"),
+                     profile="img", cpu=4, mem=16.0, created=1000.0,
+                     last_seen=1001.0, host_ip="10.0.0.1",
+                     port=30001).items():
+        setattr(record, k, v)
+    store = TaskStore(path)
+    store.save(record)
+    store.close()
+
+    cache = TaskStatusCache()
+    cache.attach(TaskStore(path))
+    restored = cache.get("t1")
+    assert restored.restored
+    for k in ("endpoint", "state", "user", "server", "key", "groups",
+              "profile", "cpu", "mem", "created", "last_seen", "host_ip",
+              "port"):
+        assert getattr(restored, k) == getattr(record, k)
+
+    cache.remove("t1")
+    assert TaskStore(path).load() == []
+
+
+def test_old_files_get_new_columns(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE tasks (task_id TEXT PRIMARY KEY, state TEXT)")
+    db.execute("INSERT INTO tasks VALUES ('t1', 'QUEUED')")
+    db.commit()
+    db.close()
+
+    row, = TaskStore(path).load()
+    assert row["task_id"] == "t1"
+    assert row["state"] == "QUEUED"
+    assert row["groups"] == ()
+    assert row["port"] is None
+
+
+def test_restored_tasks_are_checked_against_tes(make_spawner, tes, tmp_path):
+    path = str(tmp_path / "tasks.db")
+    store = TaskStore(path)
+    for task_id, state in (("live", "RUNNING"), ("ended", "COMPLETE"),
+                           ("purged", None)):
+        if state is not None:
+            tes._tasks[task_id] = {"state": state, "ready": 0, "port": 1}
+        record = TaskRecord(task_id)
+        record.user = "bob"
+        record.state = "RUNNING"
+        store.save(record)
+    store.close()
+
+    async def restore():
+        spawner = make_spawner(task_cache_path=path)
+        spawner._open_task_store()
+        await asyncio.sleep(0.1)
+        return spawner
+
+    spawner = asyncio.run(restore())
+    records = spawner._task_cache.records()
+    assert [(r.task_id, r.restored) for r in records] == [("live", False)]
+    assert [row["task_id"] for row in TaskStore(path).load()] == ["live"]